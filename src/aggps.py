@@ -0,0 +1,384 @@
+"""
+Чтение и запись папок данных Trimble AgGPS.
+
+Структура (как в data/Trimble/AgGPS):
+    AgGPS/Data/<клиент>/<ферма>/<поле>/
+        Boundary.shp     - граница поля (POLYGON, WGS84),
+        LineFeature.shp  - линейные объекты (POLYLINE),
+        Curves.shp       - линии ведения, построенные планировщиком
+                           (POLYLINE с полями LineFeature),
+        <долгота>E<широта>N<высота>H.pos - опорная точка поля
+                           (пустой файл, координаты в имени).
+
+Слои линий (LineLayer) читаются лениво: при открытии читается только
+индекс .shx, точки линии - представление над отображенным в память .shp
+(shp_reader.ShapeFileMap), атрибуты - одна запись .dbf по запросу.
+Запись слоев - export.write_shapes, целыми массивами.
+
+Запуск:
+    python aggps.py list ../data/Trimble
+    python aggps.py plan ../data/Trimble [-o каталог] [--params '{"mode": "cells"}']
+"""
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import argparse
+import datetime
+import traceback
+import typing as t
+from collections import OrderedDict
+
+import numpy as np
+import shapefile
+
+from batch_plan import ENTRY_INDEX, EXIT_INDEX
+from export import POLYGON, POLYLINE, write_shapes, tracks_to_wgs
+from planning import plan_field
+from shp_reader import ShapeFileMap, signed_area
+from utm import Field, iter_fields, local_transformer
+
+
+# Каталог данных внутри корня AgGPS
+DATA_DIR = os.path.join('AgGPS', 'Data')
+
+# Слои папки поля
+BOUNDARY = 'Boundary'
+LINE_FEATURE = 'LineFeature'
+GUIDANCE = 'Curves'
+
+# Поля .dbf слоев (как в файлах дисплея): (имя, тип, размер, знаков)
+BOUNDARY_FIELDS = [('Date', 'D', 8, 0), ('Time', 'C', 10, 0), ('Version', 'C', 8, 0),
+                   ('Id', 'N', 15, 0), ('Name', 'C', 32, 0), ('Area', 'N', 15, 4),
+                   ('Perimeter', 'N', 15, 3), ('SwathsIn', 'N', 15, 0), ('Dist1', 'N', 15, 3),
+                   ('Dist2', 'N', 15, 3), ('PrefWeight', 'N', 15, 3)]
+LINE_FIELDS = [('Date', 'D', 8, 0), ('Time', 'C', 40, 0), ('Version', 'C', 8, 0),
+               ('Id', 'N', 15, 0), ('Name', 'C', 40, 0), ('Length', 'N', 15, 3),
+               ('Dist1', 'N', 15, 3), ('Dist2', 'N', 15, 3), ('UniqueID', 'C', 16, 0)]
+
+# Имя файла опорной точки: 27.01644E53.32270N0H.pos
+POSITION_RE = re.compile(r'^(\d+(?:\.\d+)?)([EW])(\d+(?:\.\d+)?)([NS])(-?\d+(?:\.\d+)?)H\.pos$')
+
+Line = np.ndarray
+
+
+def position_filename(lon: float, lat: float, height: float = 0.0) -> str:
+    """Имя файла .pos опорной точки (градусы с 5 знаками, высота в метрах)."""
+    return '{:.5f}{}{:.5f}{}{:.0f}H.pos'.format(
+        abs(lon), 'E' if lon >= 0 else 'W', abs(lat), 'N' if lat >= 0 else 'S', height)
+
+
+def parse_position(filename: str) -> t.Optional[t.Tuple[float, float, float]]:
+    """
+    Returns:
+        (долгота, широта, высота) из имени файла .pos или None
+    """
+    match = POSITION_RE.match(os.path.basename(filename))
+    if match is None:
+        return None
+    lon, east, lat, north, height = match.groups()
+    return (float(lon) * (1 if east == 'E' else -1),
+            float(lat) * (1 if north == 'N' else -1),
+            float(height))
+
+
+class LineLayer:
+    """
+    Слой линий AgGPS (LineFeature.shp, Curves.shp) с чтением по требованию.
+
+    Точки - представления над отображенным в память .shp, они остаются
+    действительными после close(). Атрибуты читаются из .dbf по одной записи.
+    """
+
+    def __init__(self, shp_file: str):
+        self.filename = shp_file
+        self.__shp = ShapeFileMap(shp_file)
+        dbf = os.path.splitext(shp_file)[0] + '.dbf'
+        self.__dbf = shapefile.Reader(dbf=open(dbf, 'rb')) if os.path.exists(dbf) else None
+
+    def __len__(self):
+        return len(self.__shp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__shp.close()
+        if self.__dbf is not None:
+            self.__dbf.close()
+
+    def points(self, i: int) -> Line:
+        """Все точки линии i (долгота, широта), представление n x 2."""
+        return self.__shp.points(i)
+
+    def parts(self, i: int) -> t.List[Line]:
+        """Части линии i."""
+        return self.__shp.rings(i)
+
+    def record(self, i: int) -> dict:
+        """Атрибуты линии i ({} без .dbf)."""
+        if self.__dbf is None:
+            return {}
+        return self.__dbf.record(i).as_dict()
+
+    def name(self, i: int) -> str:
+        return str(self.record(i).get('Name') or i)
+
+    def __getitem__(self, i: int) -> t.Tuple[dict, Line]:
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i %= len(self)
+        return self.record(i), self.points(i)
+
+    def __iter__(self) -> t.Iterator[t.Tuple[dict, Line]]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class AgGPSField:
+    """Папка поля AgGPS/Data/<клиент>/<ферма>/<поле>."""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.normpath(directory)
+        parts = self.directory.split(os.sep)
+        self.name = parts[-1]
+        self.farm = parts[-2] if len(parts) > 1 else ''
+        self.client = parts[-3] if len(parts) > 2 else ''
+
+    def __repr__(self):
+        return 'AgGPSField({!r})'.format(self.directory)
+
+    def layer_file(self, layer: str) -> str:
+        return os.path.join(self.directory, layer + '.shp')
+
+    def has(self, layer: str) -> bool:
+        return os.path.exists(self.layer_file(layer))
+
+    @property
+    def position(self) -> t.Optional[t.Tuple[float, float, float]]:
+        """Опорная точка поля из имени файла .pos."""
+        for filename in sorted(glob.glob(os.path.join(self.directory, '*.pos'))):
+            position = parse_position(filename)
+            if position is not None:
+                return position
+        return None
+
+    def boundaries(self, projection: str = 'zone') -> t.Iterator[Field]:
+        """Полигоны границы поля (utm.iter_fields), лениво."""
+        if not self.has(BOUNDARY):
+            return iter(())
+        return iter_fields(self.layer_file(BOUNDARY), projection)
+
+    def line_features(self) -> t.Optional[LineLayer]:
+        """Линейные объекты (закрыть после использования) или None."""
+        return LineLayer(self.layer_file(LINE_FEATURE)) if self.has(LINE_FEATURE) else None
+
+    def guidance(self) -> t.Optional[LineLayer]:
+        """Линии ведения (закрыть после использования) или None."""
+        return LineLayer(self.layer_file(GUIDANCE)) if self.has(GUIDANCE) else None
+
+
+def find_fields(root: str) -> t.List[AgGPSField]:
+    """
+    Папки полей внутри root (корень с AgGPS, сам AgGPS или любой
+    вложенный каталог): каталоги с Boundary.shp, LineFeature.shp или .pos.
+    """
+    directories = set()
+    for pattern in (BOUNDARY + '.shp', LINE_FEATURE + '.shp', '*.pos'):
+        for filename in glob.glob(os.path.join(root, '**', pattern), recursive=True):
+            directories.add(os.path.dirname(os.path.normpath(filename)))
+    return [AgGPSField(d) for d in sorted(directories)]
+
+
+def field_directory(root: str, client: str, farm: str, name: str) -> str:
+    return os.path.join(root, DATA_DIR, client, farm, name)
+
+
+def __local(points):
+    """Точки WGS84 в поперечной проекции Меркатора с центром в их середине."""
+    points = np.asarray(points, dtype='float64')[:, :2]
+    lon, lat = (points.min(axis=0) + points.max(axis=0)) / 2.0
+    x, y = local_transformer(lon, lat).transform(points[:, 0], points[:, 1])
+    return np.column_stack((x, y))
+
+
+def line_lengths(lines: t.List[Line]) -> np.ndarray:
+    """Длины линий WGS84, метры (одно преобразование координат на все линии)."""
+    if not lines:
+        return np.zeros(0)
+    xy = __local(np.concatenate([np.asarray(p, dtype='float64')[:, :2] for p in lines]))
+    segments = np.hypot(*np.diff(xy, axis=0).T)
+    # отрезки между концом одной линии и началом следующей не учитываются
+    ends = np.cumsum([len(p) for p in lines])
+    segments[ends[:-1] - 1] = 0.0
+    return np.add.reduceat(np.append(segments, 0.0), np.concatenate(([0], ends[:-1])))
+
+
+def __timestamp(now):
+    return now.date(), now.strftime('%I:%M:%S%p').lower()
+
+
+def __orient(ring, clockwise):
+    ring = np.asarray(ring, dtype='float64')[:, :2]
+    if len(ring) and not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack((ring, ring[:1]))
+    return ring[::-1] if (signed_area(ring) < 0) != clockwise else ring
+
+
+def write_boundary(filename: str, polygons: t.List[t.List[Line]], name: str, now=None):
+    """
+    Записывает границу поля.
+
+    Args:
+        polygons: [[внешнее кольцо, отверстия...]] в WGS84; кольца
+                  замыкаются и ориентируются как требует shapefile
+        name: Имя поля (поле Name)
+    """
+    date, clock = __timestamp(now or datetime.datetime.now())
+    shapes, records = [], []
+    for i, polygon in enumerate(polygons, 1):
+        rings = [__orient(polygon[0], clockwise=True)] + [__orient(h, clockwise=False) for h in polygon[1:]]
+        local = [__local(r) for r in rings]
+        area = abs(signed_area(local[0])) - sum(abs(signed_area(h)) for h in local[1:])
+        perimeter = float(np.hypot(*np.diff(local[0], axis=0).T).sum())
+        shapes.append(rings)
+        records.append([date, clock, '', i, name, round(area / 1e4, 4), round(perimeter, 3),
+                        None, None, None, None])
+    write_shapes(filename, POLYGON, shapes, BOUNDARY_FIELDS, records)
+
+
+def write_lines(filename: str, lines: t.Dict[str, Line], start_id: int = 1, now=None):
+    """
+    Записывает слой линий (LineFeature или Curves).
+
+    Args:
+        lines: {имя: линия WGS84 n x 2}
+        start_id: Id первой линии
+    """
+    date, clock = __timestamp(now or datetime.datetime.now())
+    shapes = [[np.asarray(points, dtype='float64')[:, :2]] for points in lines.values()]
+    lengths = line_lengths([s[0] for s in shapes]).round(3).tolist()
+    records = [[date, clock, '', i, name, length, None, None, '']
+               for i, (name, length) in enumerate(zip(lines, lengths), start_id)]
+    write_shapes(filename, POLYLINE, shapes, LINE_FIELDS, records)
+
+
+def write_position(directory: str, lon: float, lat: float, height: float = 0.0) -> str:
+    """Создает файл .pos опорной точки (прежние .pos удаляются)."""
+    for filename in glob.glob(os.path.join(directory, '*.pos')):
+        os.remove(filename)
+    filename = os.path.join(directory, position_filename(lon, lat, height))
+    open(filename, 'w').close()
+    return filename
+
+
+def write_field(root: str,
+                client: str,
+                farm: str,
+                name: str,
+                boundary: t.List[t.List[Line]] = None,
+                line_features: t.Dict[str, Line] = None,
+                guidance: t.Dict[str, Line] = None,
+                position: t.Tuple[float, ...] = None) -> AgGPSField:
+    """
+    Создает (или обновляет) папку поля AgGPS/Data/<клиент>/<ферма>/<поле>
+    внутри root. Записываются только переданные слои.
+
+    Args:
+        boundary: Полигоны границы (см. write_boundary)
+        line_features, guidance: {имя: линия WGS84}
+        position: (долгота, широта[, высота]) опорной точки; по умолчанию -
+                  первая точка границы, если она передана
+    """
+    field = AgGPSField(field_directory(root, client, farm, name))
+    os.makedirs(field.directory, exist_ok=True)
+    if boundary:
+        write_boundary(field.layer_file(BOUNDARY), boundary, name)
+        if position is None:
+            position = tuple(np.asarray(boundary[0][0], dtype='float64')[0, :2])
+    if line_features:
+        write_lines(field.layer_file(LINE_FEATURE), line_features)
+    if guidance:
+        write_lines(field.layer_file(GUIDANCE), guidance)
+    if position is not None:
+        write_position(field.directory, *position)
+    return field
+
+
+def plan_guidance(field: AgGPSField, params: dict = None) -> t.Dict[str, Line]:
+    """
+    Маршруты сева и полива для всех полигонов границы поля.
+
+    Returns:
+        {'<работа>' или '<работа>_<номер полигона>': линия WGS84}
+    """
+    polygons = list(field.boundaries())
+    guidance = OrderedDict()
+    for k, polygon in enumerate(polygons):
+        border = polygon.get_cartesian()
+        result = plan_field(border, border[ENTRY_INDEX], border[EXIT_INDEX], params, holes=polygon.holes)
+        paths = OrderedDict((task if len(polygons) == 1 else '{}_{}'.format(task, k), data['path'])
+                            for task, data in result.items())
+        guidance.update(tracks_to_wgs(polygon, paths))
+    return guidance
+
+
+def __copy_field(field, root):
+    """Копия папки поля в root с той же структурой клиент/ферма/поле."""
+    target = AgGPSField(field_directory(root, field.client, field.farm, field.name))
+    if os.path.abspath(target.directory) != os.path.abspath(field.directory):
+        # copytree(dirs_exist_ok=True) - только с Python 3.8
+        for directory, _, files in os.walk(field.directory):
+            destination = os.path.join(target.directory, os.path.relpath(directory, field.directory))
+            os.makedirs(destination, exist_ok=True)
+            for name in files:
+                shutil.copy2(os.path.join(directory, name), destination)
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Trimble AgGPS folders')
+    parser.add_argument('command', choices=('list', 'plan'))
+    parser.add_argument('root', help='directory with AgGPS folders')
+    parser.add_argument('-o', '--output', help='root for the planned folders (default: in place)')
+    parser.add_argument('--params', default='{}', help='JSON parameters of build_path2')
+    args = parser.parse_args(argv)
+
+    fields = find_fields(args.root)
+    if not fields:
+        parser.error('no AgGPS fields found')
+
+    for field in fields:
+        if args.command == 'list':
+            layers = []
+            for layer, lines in ((LINE_FEATURE, field.line_features()), (GUIDANCE, field.guidance())):
+                if lines is not None:
+                    with lines:
+                        layers.append('{} {}'.format(layer, len(lines)))
+            print('{}/{}/{}: {} polygons, {}, position {}'.format(
+                field.client, field.farm, field.name, sum(1 for _ in field.boundaries()),
+                ', '.join(layers) or 'no lines', field.position))
+            continue
+
+        started = time.perf_counter()
+        try:
+            guidance = plan_guidance(field, json.loads(args.params))
+            if not guidance:
+                print('{}: no boundary'.format(field.directory))
+                continue
+            target = __copy_field(field, args.output) if args.output else field
+            write_lines(target.layer_file(GUIDANCE), guidance)
+        except Exception:
+            traceback.print_exc()
+            continue
+        print('{} -> {} ({} lines, {:.1f} s)'.format(
+            field.directory, target.layer_file(GUIDANCE), len(guidance), time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
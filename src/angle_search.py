@@ -0,0 +1,68 @@
+import typing as t
+
+import numpy as np
+
+
+def _serial_map(evaluate, angles):
+    return [evaluate(angle) for angle in angles]
+
+
+class AngleSearch:
+    """
+    Поиск угла маршрута покрытия с минимальной стоимостью.
+
+    Результаты оценки кэшируются по углу, evaluations - количество
+    фактически выполненных оценок.
+    """
+
+    def __init__(self, evaluate, mapper=_serial_map, on_improve=None):
+        """
+        Args:
+            evaluate: Функция angle -> (стоимость, угол, данные) или None,
+                      если для угла не удалось построить маршрут
+            mapper: Функция (evaluate, углы) -> результаты в том же порядке
+                    (список или генератор), например для параллельного расчета
+            on_improve: Вызывается с результатом (стоимость, угол, данные)
+                        каждый раз, когда найден угол лучше всех предыдущих
+        """
+        self.evaluate = evaluate
+        self.mapper = mapper
+        self.on_improve = on_improve
+        self.results = {}
+        self.evaluations = 0
+        # Лучший результат, о котором уже сообщено в on_improve
+        self.incumbent = None
+
+    def evaluate_many(self, angles: t.Iterable[float]) -> list:
+        """Оценивает углы одним пакетом, пропуская уже оцененные."""
+        angles = [round(float(a), 6) for a in angles]
+        new = sorted(set(a for a in angles if a not in self.results))
+        if new:
+            for angle, result in zip(new, self.mapper(self.evaluate, new)):
+                self.results[angle] = result
+                self.evaluations += 1
+                self.__report(result)
+        return [self.results[a] for a in angles]
+
+    def __report(self, result):
+        if result is None:
+            return
+        if self.incumbent is None or (result[0], result[1]) < (self.incumbent[0], self.incumbent[1]):
+            self.incumbent = result
+            if self.on_improve is not None:
+                self.on_improve(result)
+
+    def best(self):
+        """
+        Returns:
+            (стоимость, угол, данные) лучшего из оцененных углов
+        """
+        conf = [r for r in self.results.values() if r is not None]
+        if not conf:
+            raise ValueError("No angle produced a coverage path")
+        return min(conf, key=lambda r: (r[0], r[1]))
+
+    def grid(self, lo: float = 0.0, hi: float = 90.0, num: int = 91):
+        """Перебор углов по равномерной сетке."""
+        self.evaluate_many(np.linspace(lo, hi, num=num))
+        return self.best()
@@ -0,0 +1,191 @@
+"""
+Пакетное планирование маршрутов для многих полей.
+
+Пример:
+    python batch_plan.py ../data/Trimble -o results --workers 4
+    python batch_plan.py "fields/**/Boundary.shp" -o results --format geojson
+
+Для каждого поля в каталоге результатов создаются <поле>_<работа>.shp
+и/или <поле>.geojson (WGS84), по --format all также <поле>.tsp (двоичный
+формат терминала, см. export.write_binary) и общий summary.csv с длинами
+и временем расчета.
+Планируются все полигоны всех записей файла.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapefile
+
+from export import FORMATS, tracks_to_wgs, write_binary, write_geojson, write_shapefile
+from planning import TASKS, plan_field
+from utm import POLYGON_TYPES, PROJECTIONS, read_fields
+
+
+# Точки входа и выхода - вершины границы с этими индексами
+ENTRY_INDEX = 0
+EXIT_INDEX = -5
+
+SUMMARY_FIELDS = ['field', 'source', 'record', 'status', 'error', 'vertices', 'total_time_s'] + [
+    '{}_{}'.format(task, column) for task in TASKS for column in ('points', 'length_m', 'time_s')]
+
+
+def find_boundaries(inputs):
+    """
+    Файлы .shp с полигонами: пути к файлам, каталоги (рекурсивно) и маски.
+
+    Returns:
+        [(файл, количество записей)]
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files.extend(glob.glob(os.path.join(item, '**', '*.shp'), recursive=True))
+        else:
+            files.extend(glob.glob(item, recursive=True))
+
+    boundaries = []
+    for filename in sorted(set(os.path.normpath(f) for f in files)):
+        with shapefile.Reader(filename) as sf:
+            if sf.shapeType in POLYGON_TYPES and len(sf):
+                boundaries.append((filename, len(sf)))
+    return boundaries
+
+
+def field_names(filenames):
+    """Уникальные имена полей по путям к файлам (без общего префикса)."""
+    if len(filenames) == 1:
+        return [os.path.splitext(os.path.basename(filenames[0]))[0]]
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in filenames])
+    names = []
+    for f in filenames:
+        name = os.path.splitext(os.path.relpath(os.path.abspath(f), root))[0]
+        names.append(name.replace(os.sep, '_'))
+    return names
+
+
+def path_length(path):
+    if len(path) < 2:
+        return 0.0
+    return float(np.hypot(*np.diff(np.asarray(path)[:, :2], axis=0).T).sum())
+
+
+def plan_one(filename, index, name, output_dir, formats, params, entry_index, exit_index, projection):
+    """
+    Планирование полей одной записи shapefile (выполняется в процессе пула).
+
+    Returns:
+        Строки summary.csv - по одной на полигон записи
+    """
+    try:
+        fields = read_fields(filename, index, projection)
+    except Exception as e:
+        traceback.print_exc()
+        return [{'field': name, 'source': filename, 'record': index, 'status': 'error',
+                 'error': '{}: {}'.format(type(e).__name__, e), 'total_time_s': 0.0}]
+
+    rows = []
+    for field in fields:
+        field_name = name if len(fields) == 1 else '{}_{}'.format(name, field.part)
+        rows.append(plan_polygon(field, filename, field_name, output_dir, formats, params,
+                                 entry_index, exit_index))
+    return rows
+
+
+def plan_polygon(field, filename, name, output_dir, formats, params, entry_index, exit_index):
+    row = {'field': name, 'source': filename, 'record': field.index, 'status': 'ok', 'error': ''}
+    started = time.perf_counter()
+    try:
+        border = field.get_cartesian()
+        row['vertices'] = len(border)
+
+        result = plan_field(border, border[entry_index], border[exit_index], params, holes=field.holes)
+
+        for task, data in result.items():
+            path = data['path']
+            row['{}_points'.format(task)] = len(path)
+            row['{}_length_m'.format(task)] = round(path_length(path), 3)
+            row['{}_time_s'.format(task)] = round(data['time'], 3)
+        tracks = tracks_to_wgs(field, OrderedDict((task, data['path']) for task, data in result.items()))
+
+        if 'shp' in formats:
+            for task, track in tracks.items():
+                write_shapefile(os.path.join(output_dir, '{}_{}.shp'.format(name, task)), {task: track})
+        if 'geojson' in formats:
+            write_geojson(os.path.join(output_dir, '{}.geojson'.format(name)), tracks)
+        if 'bin' in formats:
+            write_binary(os.path.join(output_dir, '{}.tsp'.format(name)), tracks)
+    except Exception as e:
+        row['status'] = 'error'
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+        traceback.print_exc()
+    row['total_time_s'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетное планирование маршрутов сева и полива')
+    parser.add_argument('inputs', nargs='+', help='Файлы .shp, каталоги или маски (в кавычках)')
+    parser.add_argument('-o', '--output', default='batch_results', help='Каталог результатов')
+    parser.add_argument('--format', choices=FORMATS + ('both', 'all'), default='both',
+                        help='both: shp and geojson; all: also the binary .tsp track file')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Количество процессов (по умолчанию по количеству ядер)')
+    parser.add_argument('--params', default='{}', help='Параметры build_path2 в формате JSON')
+    parser.add_argument('--entry-index', type=int, default=ENTRY_INDEX,
+                        help='Индекс вершины границы - точки входа')
+    parser.add_argument('--exit-index', type=int, default=EXIT_INDEX,
+                        help='Индекс вершины границы - точки выхода')
+    parser.add_argument('--projection', choices=PROJECTIONS, default='zone',
+                        help='zone - зона UTM центра поля, local - поперечная проекция Меркатора '
+                             'с центром в поле')
+    args = parser.parse_args(argv)
+
+    boundaries = find_boundaries(args.inputs)
+    if not boundaries:
+        parser.error('no polygon shapefiles found')
+    os.makedirs(args.output, exist_ok=True)
+
+    params = json.loads(args.params)
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1:
+        # Поля уже считаются параллельно - углы каждого поля перебираются в своем процессе
+        params.setdefault('sweep_workers', 1)
+    formats = {'both': ('shp', 'geojson'), 'all': FORMATS}.get(args.format, (args.format,))
+    # Задание - одна запись файла; в файле с несколькими записями
+    # к имени поля добавляется номер записи
+    jobs = []
+    names = field_names([f for f, _ in boundaries])
+    for (f, count), name in zip(boundaries, names):
+        for index in range(count):
+            jobs.append((f, index, name if count == 1 else '{}_{}'.format(name, index),
+                         args.output, formats, params, args.entry_index, args.exit_index,
+                         args.projection))
+
+    started = time.perf_counter()
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = [row for rows in pool.map(plan_one, *zip(*jobs)) for row in rows]
+    else:
+        rows = [row for job in jobs for row in plan_one(*job)]
+
+    with open(os.path.join(args.output, 'summary.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    failed = sum(row['status'] != 'ok' for row in rows)
+    print('{} fields planned, {} failed in {:.1f} s -> {}'.format(
+        len(rows) - failed, failed, time.perf_counter() - started, args.output))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
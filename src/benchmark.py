@@ -0,0 +1,308 @@
+"""
+Замеры производительности этапов планирования.
+
+Для каждого поля (поля Trimble из data и поля field_generator, в том числе
+серии с растущим количеством вершин и площадью) и каждого этапа измеряются время
+(минимум и медиана из repeat запусков) и пиковый объем памяти (tracemalloc,
+отдельный запуск). Для сгенерированных полей считается наклон
+log(время) / log(вершин или площади) - показатель роста времени.
+
+Запуск:
+    python benchmark.py [-o результат.json] [--repeat 3] [--only coverage,smoother]
+                        [--quick] [--compare прошлый_результат.json]
+"""
+import os
+import gc
+import contextlib
+import json
+import time
+import glob
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+import scipy
+import shapely
+
+from utm import Converter
+from coverage_planning import AreaPolygon
+from smoother import PathSmoother
+from offset_rings import offset_rings
+from perimeter import invalidate
+from plan_cache import ALGORITHM_VERSION
+from field_generator import KINDS, generate_field, generate_fields, write_field_files
+from border_path import (build_path2, find_best_coverage_path,
+                         polygon_perimeter_between_points, MAX_CURV, SMOOTH_METHOD)
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'Trimble')
+
+# Ширина прохода покрытия и отступ от границы поля, метры
+FT = 10.0
+STEP = 5.0
+
+# Угол маршрута покрытия для замеров одного угла, градусы
+ANGLE = 30.0
+
+# Количество точек пути для замера сглаживания
+SMOOTH_POINTS = 400
+
+# Количество пар точек для замера переездов по периметру
+PERIMETER_PAIRS = 50
+
+# Сгенерированные поля: количество вершин (при площади SERIES_AREA)
+# и площади полей, м^2 (при SERIES_VERTICES вершинах)
+VERTEX_COUNTS = (16, 64, 256, 1024)
+AREAS = (1e5, 4e5, 1.6e6, 6.4e6)
+SERIES_AREA = 4e5
+SERIES_VERTICES = 64
+
+
+def trimble_fields():
+    """Поля Trimble: {имя: {'coords': координаты, 'filename': файл}}."""
+    fields = OrderedDict()
+    for filename in sorted(glob.glob(os.path.join(DATA_DIR, '**', '*.shp'), recursive=True)):
+        if os.path.basename(filename) in ('Boundary.shp', 'Pole.shp'):
+            fields[os.path.relpath(filename, DATA_DIR)] = {
+                'coords': Converter(filename).get_cartesian(),
+                'filename': filename,
+            }
+    return fields
+
+
+def generated_fields(vertex_counts=VERTEX_COUNTS, areas=AREAS, directory=None):
+    """
+    Поля field_generator: по одному полю каждого вида (KINDS) и две серии -
+    поля с шумом GPS с растущим количеством вершин и L-образные поля
+    растущей площади. Если задан directory, поля записываются туда
+    в shapefile (для замера Converter).
+
+    Returns:
+        {имя: {'coords': координаты, 'series': ['vertices' и/или 'area'],
+               'filename': файл}}
+    """
+    kinds = generate_fields(KINDS, area=SERIES_AREA, vertices=SERIES_VERTICES)
+    fields = OrderedDict((name, {'boundary': field, 'series': []}) for name, field in kinds.items())
+    for n in vertex_counts:
+        fields.setdefault('noisy_v{}_a{:g}'.format(n, SERIES_AREA), {
+            'boundary': generate_field('noisy', area=SERIES_AREA, vertices=n),
+            'series': []})['series'].append('vertices')
+    for area in areas:
+        fields.setdefault('l_shape_v{}_a{:g}'.format(SERIES_VERTICES, area), {
+            'boundary': generate_field('l_shape', area=area, vertices=SERIES_VERTICES),
+            'series': []})['series'].append('area')
+
+    if directory is not None:
+        files = write_field_files(directory, OrderedDict((n, f['boundary']) for n, f in fields.items()))
+        for name, filename in files.items():
+            fields[name]['filename'] = filename
+    for field in fields.values():
+        field['coords'] = field.pop('boundary')[0]
+    return fields
+
+
+def _densify(path, step=10.0):
+    points = [np.asarray(path[0], dtype='float64')]
+    for p1, p2 in zip(path[:-1], path[1:]):
+        num = max(2, int(np.hypot(p2[0] - p1[0], p2[1] - p1[1]) / step))
+        points.extend(np.linspace(p1, p2, num=num)[1:])
+    return np.array(points)
+
+
+# Этапы: функция (поле) -> функция без аргументов для замера
+# или None, если этап для поля не применим
+
+def bench_coverage(field):
+    coords = field['coords']
+    return lambda: AreaPolygon(coords, coords[0], interior=[], ft=FT, angle=ANGLE).get_area_coverage()
+
+
+def bench_best_coverage(field):
+    coords = field['coords']
+    circle = offset_rings.offset(coords, STEP * 3)
+    coverage = offset_rings.offset(coords, STEP * 5)
+    if not circle or not coverage:
+        return None
+    start, exit = circle[0], circle[len(circle) // 2]
+    return lambda: find_best_coverage_path(coverage, circle, start, exit, STEP * 2, workers=1)
+
+
+def bench_smoother(field):
+    coords = field['coords']
+    path = list(AreaPolygon(coords, coords[0], interior=[], ft=FT, angle=ANGLE).get_area_coverage().coords)
+    x0 = _densify(path)[:SMOOTH_POINTS].reshape((-1))
+    smoother = PathSmoother(MAX_CURV, tol=1e-2, method=SMOOTH_METHOD)
+    return lambda: smoother.smooth(x0)
+
+
+def bench_perimeter(field):
+    coords = field['coords']
+    rng = np.random.default_rng(0)
+    pairs = rng.integers(0, len(coords) - 1, size=(PERIMETER_PAIRS, 2))
+
+    def run():
+        for i, j in pairs:
+            polygon_perimeter_between_points(coords[i], coords[j], coords)
+    return run
+
+
+def bench_build_path(field):
+    coords = field['coords']
+
+    def run():
+        # без кэшей предыдущих запусков
+        offset_rings.clear()
+        invalidate()
+        build_path2(coords, coords[0], coords[len(coords) // 2], STEP, {'sweep_workers': 1}, {})
+    return run
+
+
+def bench_converter(field):
+    filename = field.get('filename')
+    if filename is None:
+        return None
+    return lambda: Converter(filename).get_cartesian()
+
+
+BENCHMARKS = OrderedDict([
+    ('coverage', bench_coverage),
+    ('best_coverage', bench_best_coverage),
+    ('smoother', bench_smoother),
+    ('perimeter', bench_perimeter),
+    ('build_path2', bench_build_path),
+    ('converter', bench_converter),
+])
+
+
+def measure(run, repeat=3):
+    """
+    Returns:
+        {'time_min', 'time_median': время, с; 'peak_kb': пиковая память, КБ}
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time_min': min(times), 'time_median': float(np.median(times)), 'peak_kb': peak / 1024.0}
+
+
+def field_size(coords):
+    points = np.asarray(coords, dtype='float64')
+    x, y = points[:, 0], points[:, 1]
+    area = 0.5 * abs(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+    return len(points) - 1, area
+
+
+def scaling(results):
+    """Наклон log(время) по log(вершин) и log(площади) для серий сгенерированных полей."""
+    curves = {}
+    for bench in BENCHMARKS:
+        for series, size in (('vertices', 'vertices'), ('area', 'area')):
+            rows = [r for r in results if r['benchmark'] == bench and series in r.get('series', ())]
+            if len(rows) < 2:
+                continue
+            rows.sort(key=lambda r: r[size])
+            x = np.log([r[size] for r in rows])
+            y = np.log([r['time_median'] for r in rows])
+            curves.setdefault(bench, {})[series] = {
+                'exponent': float(np.polyfit(x, y, 1)[0]),
+                'points': [[r[size], r['time_median']] for r in rows],
+            }
+    return curves
+
+
+def run_benchmarks(fields, names=None, repeat=3, log=print):
+    results = []
+    for bench, setup in BENCHMARKS.items():
+        if names and bench not in names:
+            continue
+        for field_name, field in fields.items():
+            run = setup(field)
+            if run is None:
+                continue
+            vertices, area = field_size(field['coords'])
+            row = OrderedDict([('benchmark', bench), ('field', field_name),
+                               ('vertices', vertices), ('area', area)])
+            if 'series' in field:
+                row['series'] = list(field['series'])
+            row.update(measure(run, repeat))
+            results.append(row)
+            log('{:14s} {:45s} {:6d} {:10.4f} s {:10.1f} KB'.format(
+                bench, field_name, vertices, row['time_median'], row['peak_kb']))
+    return results
+
+
+def metadata(repeat):
+    return {
+        'algorithm_version': ALGORITHM_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'shapely': shapely.__version__,
+        'repeat': repeat,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(report, baseline):
+    """Печатает отношение медианного времени к времени из прошлого отчета."""
+    old = {(r['benchmark'], r['field']): r for r in baseline['results']}
+    print('\n{:14s} {:45s} {:>10s} {:>10s} {:>7s}'.format('benchmark', 'field', 'old, s', 'new, s', 'ratio'))
+    for r in report['results']:
+        base = old.get((r['benchmark'], r['field']))
+        if base is None:
+            continue
+        print('{:14s} {:45s} {:10.4f} {:10.4f} {:7.2f}'.format(
+            r['benchmark'], r['field'], base['time_median'], r['time_median'],
+            r['time_median'] / base['time_median']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Planning pipeline benchmarks')
+    parser.add_argument('-o', '--output', help='JSON report file')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='comma separated benchmarks: ' + ','.join(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='two smallest generated fields per series')
+    parser.add_argument('--fields-dir', help='keep generated shapefiles in this directory')
+    parser.add_argument('--compare', help='previous JSON report')
+    args = parser.parse_args()
+
+    # сгенерированные поля во временном каталоге, если --fields-dir не задан
+    fields_dir = (contextlib.nullcontext(args.fields_dir) if args.fields_dir
+                  else tempfile.TemporaryDirectory(prefix='fields_'))
+    with fields_dir as directory:
+        if args.quick:
+            fields = dict(trimble_fields(), **generated_fields(VERTEX_COUNTS[:2], AREAS[:2], directory))
+        else:
+            fields = dict(trimble_fields(), **generated_fields(directory=directory))
+        names = args.only.split(',') if args.only else None
+
+        report = {
+            'meta': metadata(args.repeat),
+            'results': run_benchmarks(fields, names, args.repeat),
+        }
+    report['scaling'] = scaling(report['results'])
+    for bench, curves in report['scaling'].items():
+        print('{:14s} '.format(bench) + '  '.join(
+            'time ~ {}^{:.2f}'.format(series, c['exponent']) for series, c in curves.items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -1,16 +1,22 @@
 # python3.7+
 
 import typing as t
-import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
 from scipy import spatial
 
 import matplotlib.pyplot as plt
 from shapely import geometry
-from shapely.ops import nearest_points
+from shapely.ops import unary_union
 
 import constants as const
+from angle_search import AngleSearch
+from perimeter import PerimeterIndex, prepared_ring
+from offset_rings import offset_rings, ring_key, JOIN_ROUND
 from coverage_planning import AreaPolygon
+from export import write_json
 from smoother import PathSmoother
 
 
@@ -24,32 +30,61 @@ GO_AROUND_TWICE = False
 # (выставить в 0 чтобы круг полностью замкнулся)
 STOP_DIST = 0.3
 
+# Максимальная кривизна траектории без штрафа при сглаживании, 1/метр
+MAX_CURV = 1.0 / 5.0
+
+# Метод сглаживания траектории: метод scipy.optimize.minimize (например 'CG')
+# или 'banded' - прямое решение ленточной системы
+SMOOTH_METHOD = 'CG'
+
+# Количество процессов для перебора углов покрытия
+# (None - по количеству ядер, 1 - перебор в текущем процессе)
+SWEEP_WORKERS = None
+
+# Режим покрытия: 'boustrophedon' - жадный обход всех проходов,
+# 'cells' - разбиение на ячейки в критических точках полигона
+# с отдельным обходом каждой ячейки (см. AreaPolygon.get_area_coverage)
+COVERAGE_MODE = 'boustrophedon'
+
+# Сглаживание окнами: максимальный размер окна и запас вокруг поворота, точки
+SMOOTH_WINDOW = 200
+SMOOTH_MARGIN = 5
+
+# Сколько сглаженных окон хранить в кэше сеанса планирования
+SMOOTH_CACHE_SIZE = 10000
+
+
+class PlanningCancelled(Exception):
+    """Планирование прервано через параметр 'cancel' (см. build_path2)."""
+
+
+def __check_cancelled(cancel):
+    """
+    Args:
+        cancel: Объект с методом is_set() (например, threading.Event) или None
+    """
+    if cancel is not None and cancel.is_set():
+        raise PlanningCancelled()
+
 
 def __shrink_or_swell_polygon(coords: t.List[t.Tuple[float, float]],
                               shrink_dist: float = 1.0,
-                              swell: bool = False):
+                              swell: bool = False,
+                              join_style: int = JOIN_ROUND):
     """
     Сжимает или расширяет полигон на заданный отступ.
+    Результаты кэшируются (см. offset_rings.OffsetRings).
 
     Args:
         coords: Координаты полигона
         swell: Флаг растягивания/сжатия
         shrink_dist: Растояние отступа от границы исходного полигона
+        join_style: Тип углов (1 - round, 2 - mitre, 3 - bevel)
 
     Returns:
         Координаты полученного полигона
     """
-    polygon = geometry.Polygon(coords)
-
-    if swell:
-        polygon_resized = polygon.buffer(shrink_dist)  # Растянуть
-    else:
-        polygon_resized = polygon.buffer(-shrink_dist)  # Сжать
-
-    if polygon_resized.is_empty:
-        return []
-
-    return list(geometry.mapping(polygon_resized)['coordinates'][0])
+    return offset_rings.offset(coords, shrink_dist, join_style=join_style, swell=swell)
 
 
 def nearest_polygon_point(point: t.Tuple[float, float],
@@ -62,12 +97,13 @@ def nearest_polygon_point(point: t.Tuple[float, float],
         poly: Координаты полигона
 
     Returns:
-        Ближайшая точка
+        Ближайшая точка (сама точка, если она внутри полигона)
+
+    Полигон подготавливается один раз и хранится в кэше perimeter.prepared_ring
+    по объекту списка poly. После изменения списка на месте вызовите
+    perimeter.invalidate(poly).
     """
-    poly = geometry.Polygon(poly)
-    point = geometry.Point(point)
-    p1 = nearest_points(poly, point)[0]
-    return p1.x, p1.y
+    return prepared_ring(poly).nearest_point(point)
 
 
 def build_n_offset_paths(path: t.List[t.Tuple[float, float]], 
@@ -125,14 +161,8 @@ def build_n_tracks(border: t.List[t.Tuple[float, float]],
     """
     dwidth = width / n_rows
 
-    temp_border = border
-    borders = list()
-    for i in range(n_rows):
-        shrinked_border = __shrink_or_swell_polygon(temp_border, dwidth)
-        borders.append(shrinked_border)
-        temp_border = shrinked_border
-
-    return borders 
+    # Каждое кольцо сжимается из предыдущего, все шаги кэшируются
+    return offset_rings.successive(border, dwidth, n_rows)
     
 
 def __nearest_polygon_points(point, poly) -> t.Tuple[t.Tuple[float, float],
@@ -179,28 +209,10 @@ def polygon_perimeter_between_points(p1: t.Tuple[float, float],
         p1: точка старта обхода
         p2: целевая точка
         poly: полигон
-    """
-    start1, start1_idx = find_point_and_index_of_nearest_point(p1, poly)
-    end1, end1_idx = find_point_and_index_of_nearest_point(p2, poly)
-
-    if start1_idx == end1_idx:
-        return [], 0.0
 
-    if start1_idx > end1_idx:
-        p_l = len(poly)
-        poly = poly[:] + poly[:]
-        end1_idx += p_l
-
-    full_path = []
-    last_p = start1
-    dist = 0
-    for i in range(start1_idx, end1_idx + 1):
-        cur_p = poly[i]
-        full_path.append(cur_p)
-        dist += dist_between_points(last_p, cur_p)
-        last_p = cur_p
-
-    return full_path, dist
+    Для повторных запросов по одному полигону используйте perimeter.PerimeterIndex.
+    """
+    return PerimeterIndex(poly).path_between(p1, p2)
 
 
 def build_path(border: t.List[t.Tuple[float, float]],
@@ -220,6 +232,8 @@ def build_path(border: t.List[t.Tuple[float, float]],
     exit_point: Координаты точки выхода.
     border_step: Необходимое растояние от границы поля до траектории в метрах.
                  Должно быть равно половине длины агрегата (сеялки/поливалки)
+    params: Параметры планирования:
+            'smooth_method' - метод сглаживания (по умолчанию SMOOTH_METHOD)
     """
     inner_polygon = __shrink_or_swell_polygon(
         coords=border,
@@ -239,26 +253,27 @@ def build_path(border: t.List[t.Tuple[float, float]],
         coords=inner_polygon,
         shrink_dist=border_step
     )
+    perimeter = PerimeterIndex(circle_path)
     coverage_path, cov_start_point, cov_end_point = find_best_coverage_path(
         coverage_polygon,
-        circle_path,
+        perimeter,
         start_point,
         exit_point_at_cp,
-        border_step * 2
+        border_step * 2,
+        workers=params.get('sweep_workers', SWEEP_WORKERS),
+        mode=params.get('coverage_mode', COVERAGE_MODE),
+        debug_data=debug_data
     )
 
 
     start_point_at_cp = nearest_polygon_point(cov_start_point, circle_path)
     end_point_at_cp = nearest_polygon_point(cov_end_point, circle_path)
 
-    path_to_coverage_start_point, _ = polygon_perimeter_between_points(start_point,
-                                                                       start_point_at_cp,
-                                                                       circle_path)
-    path_to_end_point, _ = polygon_perimeter_between_points(end_point_at_cp,
-                                                            exit_point_at_cp, 
-                                                            circle_path)
+    path_to_coverage_start_point, _ = perimeter.path_between(start_point, start_point_at_cp)
+    path_to_end_point, _ = perimeter.path_between(end_point_at_cp, exit_point_at_cp)
 
-    coverage_path = smooth_coverage_path(path_to_coverage_start_point + coverage_path + path_to_end_point + [exit_point])
+    coverage_path = smooth_coverage_path(path_to_coverage_start_point + coverage_path + path_to_end_point + [exit_point],
+                                         method=params.get('smooth_method', SMOOTH_METHOD))
 
     full_path = stitch_path(circle_path, coverage_path)
 
@@ -297,7 +312,9 @@ def build_path2(border: t.List[t.Tuple[float, float]],
                 border_step: float,
                 params: dict,
                 debug_data = {},
-                path_name: str = "1") -> list:
+                path_name: str = "1",
+                cache: dict = None,
+                holes: t.List[t.List[t.Tuple[float, float]]] = ()) -> list:
     """
     Строит маршрут вдоль границ площадки
 
@@ -308,62 +325,95 @@ def build_path2(border: t.List[t.Tuple[float, float]],
     exit_point: Координаты точки выхода.
     border_step: Необходимое растояние от границы поля до траектории в метрах.
                  Должно быть равно половине длины агрегата (сеялки/поливалки)
+    params: Параметры планирования:
+            'smooth_method' - метод сглаживания (по умолчанию SMOOTH_METHOD)
+            'smooth_window' - сглаживать маршрут покрытия окнами такого размера
+            'sweep_workers' - количество процессов для перебора углов
+                              (по умолчанию SWEEP_WORKERS)
+            'coverage_mode' - режим покрытия (по умолчанию COVERAGE_MODE)
+            'cancel' - флаг отмены с методом is_set() (например, threading.Event);
+                       если он установлен, расчет прерывается исключением
+                       PlanningCancelled
+            'progress' - функция (этап, маршрут) для промежуточных результатов:
+                         'circle' - круг вдоль границ,
+                         'coverage' - круг и лучший из найденных маршрутов
+                                      покрытия без сглаживания (при каждом
+                                      улучшении во время перебора углов),
+                         'final' - итоговый маршрут
+    cache: Словарь для этапов, не зависящих от точек входа и выхода
+           (круги вдоль границ, маршруты покрытия по углам, сглаживание окон).
+           При повторном вызове с тем же словарем и теми же границей, отступом,
+           методом сглаживания и режимом покрытия пересчитываются только
+           переезды и выбор угла (см. planning.PlanningSession).
+           Словарь сбрасывается, если эти параметры изменились.
+    holes: Координаты препятствий внутри поля (список колец).
+           Маршрут покрытия обходит их с отступом border_step.
     """
-    inner_polygon = __shrink_or_swell_polygon(
-        coords=border,
-        shrink_dist=border_step
-    )
-
-    # inner_polygon = smooth_data(inner_polygon)
-    if not inner_polygon:
-        print("border_step is too big! Choose smaller value.")
-        circle_path = []
-    else:
-        start_point = nearest_polygon_point(entry_point, inner_polygon)
-        circle_path = add_points(inner_polygon[:-1])
-        # circle_path = smooth_data(circle_path)
-        circle_path2 =  __shrink_or_swell_polygon(
-            coords=border,
-            shrink_dist=border_step * 3
-        )
+    cancel = params.get('cancel')
+    progress = params.get('progress')
+    smooth_method = params.get('smooth_method', SMOOTH_METHOD)
+    mode = params.get('coverage_mode', COVERAGE_MODE)
+    __check_cancelled(cancel)
+
+    # Этапы, не зависящие от точек входа и выхода
+    cache = {} if cache is None else cache
+    key = (ring_key(border), tuple(ring_key(h) for h in holes), border_step, smooth_method, mode)
+    if cache.get('key') != key:
+        cache.clear()
+        cache['key'] = key
+    if 'rings' not in cache:
+        cache['rings'] = __prepare_rings(border, border_step, smooth_method, cancel, holes)
+    rings = cache['rings']
+    circle_path = rings['circle_path']
+    circle_path2 = rings['circle_path2']
+    perimeter2 = rings['perimeter2']
+
+    if circle_path:
+        start_point = nearest_polygon_point(entry_point, rings['inner_polygon'])
         start_point2 = nearest_polygon_point(entry_point, circle_path2)
 
     exit_point_at_cp = nearest_polygon_point(exit_point, circle_path)
     exit_point_at_cp2 = nearest_polygon_point(exit_point, circle_path2)
 
-    smoothed_circle_path = smooth_coverage_path(circle_path[len(circle_path) - 4: len(circle_path) - 1] + circle_path2[:4])
-    full_circle_path = smooth_data([entry_point, start_point] + circle_path[:5]) + circle_path[5: len(circle_path) - 4] + smoothed_circle_path + circle_path2[4:]
+    full_circle_path = smooth_data([entry_point, start_point] + circle_path[:5], method=smooth_method) + circle_path[5: len(circle_path) - 4] + rings['smoothed_circle_path'] + circle_path2[4:]
+    if progress is not None:
+        progress('circle', full_circle_path)
 
-    coverage_polygon = __shrink_or_swell_polygon(
-        coords=border,
-        shrink_dist=border_step * 5
-    )
-    coverage_path, cov_start_point, cov_end_point = find_best_coverage_path(
+    coverage_polygon = rings['coverage_polygon']
+    connect = partial(__connect_coverage_path, perimeter2, start_point2, exit_point_at_cp2, exit_point)
+    if progress is not None:
+        on_improve = lambda *coverage: progress('coverage', stitch_path(full_circle_path, connect(*coverage)))
+    else:
+        on_improve = None
+    coverage_path = find_best_coverage_path(
         coverage_polygon,
-        circle_path2,
+        perimeter2,
         start_point,
         exit_point_at_cp,
-        border_step * 2
+        border_step * 2,
+        workers=params.get('sweep_workers', SWEEP_WORKERS),
+        mode=mode,
+        debug_data=debug_data,
+        cancel=cancel,
+        on_improve=on_improve,
+        coverages=cache.setdefault('coverages', {}),
+        holes=rings['coverage_holes']
     )
+    # Маршрут покрытия без переездов по кругу и сглаживания
+    debug_data['cov_path'] = coverage_path[0]
 
-
-    start_point_at_cp = nearest_polygon_point(cov_start_point, circle_path2)
-    end_point_at_cp = nearest_polygon_point(cov_end_point, circle_path2)
-
-    path_to_coverage_start_point, _ = polygon_perimeter_between_points(start_point2,
-                                                                       start_point_at_cp,
-                                                                       circle_path2)
-    path_to_end_point, _ = polygon_perimeter_between_points(end_point_at_cp,
-                                                            exit_point_at_cp2, 
-                                                            circle_path2)
-
-    path_to_end_point = path_to_end_point + [exit_point] #+ add_points([exit_point_at_cp2, end_point_at_cp, exit_point])
-
-    coverage_path = smooth_coverage_path(path_to_coverage_start_point + coverage_path + path_to_end_point)
+    coverage_path = smooth_coverage_path(connect(*coverage_path),
+                                         method=smooth_method,
+                                         window=params.get('smooth_window'),
+                                         cancel=cancel,
+                                         cache=cache.setdefault('smoothing', {}))
 
     full_path = stitch_path(full_circle_path, coverage_path)
+    if progress is not None:
+        progress('final', full_path)
 
     debug_data['cov_poly'] = coverage_polygon
+    debug_data['cov_holes'] = rings['coverage_holes']
 
     # Отрисовка в режиме отладки
     if DEBUG:
@@ -392,8 +442,91 @@ def build_path2(border: t.List[t.Tuple[float, float]],
 
 
 
-def smooth_data(path):
-    smoother = PathSmoother(1.0 / 5.0, tol=1e-2)
+def __prepare_rings(border, border_step, smooth_method, cancel=None, holes=()) -> dict:
+    """
+    Круги вдоль границ и полигон покрытия - этапы build_path2,
+    не зависящие от точек входа и выхода.
+    """
+    inner_polygon = __shrink_or_swell_polygon(
+        coords=border,
+        shrink_dist=border_step
+    )
+
+    # inner_polygon = smooth_data(inner_polygon)
+    if not inner_polygon:
+        print("border_step is too big! Choose smaller value.")
+        circle_path = []
+        circle_path2 = []
+    else:
+        circle_path = add_points(inner_polygon[:-1])
+        # circle_path = smooth_data(circle_path)
+        circle_path2 =  __shrink_or_swell_polygon(
+            coords=border,
+            shrink_dist=border_step * 3
+        )
+
+    smoothed_circle_path = smooth_coverage_path(circle_path[len(circle_path) - 4: len(circle_path) - 1] + circle_path2[:4],
+                                                method=smooth_method,
+                                                cancel=cancel)
+
+    coverage_polygon = __shrink_or_swell_polygon(
+        coords=border,
+        shrink_dist=border_step * 5
+    )
+    coverage_polygon, coverage_holes = __subtract_holes(coverage_polygon, holes, border_step)
+    return {
+        'inner_polygon': inner_polygon,
+        'circle_path': circle_path,
+        'circle_path2': circle_path2,
+        'smoothed_circle_path': smoothed_circle_path,
+        'coverage_polygon': coverage_polygon,
+        'coverage_holes': coverage_holes,
+        'perimeter2': PerimeterIndex(circle_path2),
+    }
+
+
+def __subtract_holes(coverage_polygon, holes, border_step):
+    """
+    Вырезает из полигона покрытия препятствия, расширенные на border_step.
+
+    Returns:
+        (внешняя граница, [препятствия внутри нее]). Препятствия, задевающие
+        внешнюю границу, становятся ее частью. Если препятствия разделили
+        полигон на части, покрывается наибольшая из них.
+    """
+    if not coverage_polygon or not len(holes):
+        return coverage_polygon, []
+    obstacles = [geometry.Polygon(__shrink_or_swell_polygon(coords=h, shrink_dist=border_step, swell=True))
+                 for h in holes]
+    region = geometry.Polygon(coverage_polygon).difference(unary_union(obstacles))
+    if isinstance(region, geometry.MultiPolygon):
+        region = max(region.geoms, key=lambda p: p.area)
+    if not isinstance(region, geometry.Polygon) or region.is_empty:
+        return [], []
+    # Направление обхода как у исходного полигона покрытия
+    sign = 1.0 if geometry.LinearRing(coverage_polygon).is_ccw else -1.0
+    region = geometry.polygon.orient(region, sign=sign)
+    return list(region.exterior.coords), [list(r.coords) for r in region.interiors]
+
+
+def __connect_coverage_path(perimeter, start_point, exit_point_at_cp, exit_point,
+                            coverage_path, cov_start_point, cov_end_point):
+    """
+    Добавляет к маршруту покрытия переезды по кругу perimeter:
+    от start_point до начала покрытия и от конца покрытия до точки выхода.
+    """
+    start_point_at_cp = perimeter.nearest_point(cov_start_point)
+    end_point_at_cp = perimeter.nearest_point(cov_end_point)
+
+    path_to_coverage_start_point, _ = perimeter.path_between(start_point, start_point_at_cp)
+    path_to_end_point, _ = perimeter.path_between(end_point_at_cp, exit_point_at_cp)
+
+    path_to_end_point = path_to_end_point + [exit_point] #+ add_points([exit_point_at_cp2, end_point_at_cp, exit_point])
+    return path_to_coverage_start_point + coverage_path + path_to_end_point
+
+
+def smooth_data(path, method: str = SMOOTH_METHOD):
+    smoother = PathSmoother(MAX_CURV, tol=1e-2, method=method)
     x0 = np.array(path)
 
     x0 = x0.reshape((-1))
@@ -417,7 +550,13 @@ def add_points(poly):
     return big_x0
 
 
-def smooth_coverage_path(path):
+def __densify_path(path) -> np.ndarray:
+    """
+    Разбивает отрезки пути на точки через каждые 10 метров.
+
+    Returns:
+        Матрица nx2
+    """
     big_x0 = list()
     for i in range(1, len(path)):
         p1 = np.array(path[i-1])
@@ -426,80 +565,320 @@ def smooth_coverage_path(path):
 
         s = np.linspace(p1, p2, num=int(ds / 10.0))
         big_x0.extend(s.tolist())
-    
-    # for i in range(5, len(path)):
-    #     p1 = np.array(path[i-1])
-    #     p2 = np.array(path[i])
-    #     ds = np.linalg.norm(p1-p2)
+    return np.array(big_x0).reshape((-1, 2))
 
-    #     s = np.linspace(p1, p2, num=int(ds / 1.0))
-    #     big_x0.extend(s.tolist())
-    x0 = np.array(big_x0)
 
-    x0 = x0.reshape((-1))
-    smoother = PathSmoother(1.0 / 5.0, tol=1e-2)
+def smooth_coverage_path(path, method: str = SMOOTH_METHOD, window: int = None, cancel=None, cache=None):
+    """
+    Сглаживает маршрут покрытия.
+
+    Args:
+        path: Маршрут
+        method: Метод сглаживания
+        window: Если задан - сглаживание окнами по window точек
+                только вокруг поворотов (см. iter_smoothed_path)
+        cancel: Флаг отмены, проверяется перед каждой оптимизацией
+        cache: Кэш сглаженных окон (см. iter_smoothed_path)
+    """
+    __check_cancelled(cancel)
+    if window:
+        return list(iter_smoothed_path(path, method=method, window=window, cancel=cancel, cache=cache))
+
+    x0 = __densify_path(path).reshape((-1))
+    smoother = PathSmoother(MAX_CURV, tol=1e-2, method=method)
     res = smoother.smooth(x0).tolist()
     return res
 
 
+def iter_smoothed_path(path,
+                       method: str = SMOOTH_METHOD,
+                       window: int = SMOOTH_WINDOW,
+                       margin: int = SMOOTH_MARGIN,
+                       cancel=None,
+                       cache: dict = None) -> t.Iterator[t.List[float]]:
+    """
+    Сглаживает маршрут перекрывающимися окнами и отдает точки по одной.
+
+    Оптимизируются только участки вокруг поворотов (кривизна больше MAX_CURV)
+    с запасом margin точек, прямые участки отдаются как есть.
+    Участок длиннее window точек сглаживается по частям с перекрытием
+    2 * margin точек. Первая точка следующей части закрепляется в точке
+    сглаженного результата предыдущей части, которая идет сразу после
+    отданных (ее отдает уже следующая часть), а крайние точки участка -
+    в исходных, поэтому швы непрерывны.
+
+    Args:
+        path: Маршрут
+        method: Метод сглаживания
+        window: Максимальное количество точек в одной оптимизации
+        margin: Запас точек вокруг поворота
+        cancel: Флаг отмены, проверяется перед каждой оптимизацией
+        cache: Словарь (содержимое окна -> результат) для повторного
+               использования сглаживания неизменившихся окон; хранит
+               не больше SMOOTH_CACHE_SIZE окон
+
+    Returns:
+        Генератор точек [x, y]
+    """
+    x = __densify_path(path)
+    n = len(x)
+    overlap = 2 * margin
+    if window <= overlap:
+        raise ValueError("window must be greater than 2 * margin")
+
+    smoother = PathSmoother(MAX_CURV, tol=1e-2, method=method)
+    curvature = smoother.calc_curvatire(x)[0] if n > 2 else np.zeros(n)
+    turns = np.flatnonzero(~(curvature <= MAX_CURV))
+
+    # Объединение пересекающихся окон вокруг поворотов
+    starts = np.maximum(turns - margin, 0)
+    stops = np.minimum(turns + margin, n - 1)
+    if turns.size:
+        new = np.r_[True, starts[1:] > np.maximum.accumulate(stops)[:-1]]
+        starts = starts[new]
+        stops = np.maximum.reduceat(stops, np.flatnonzero(new))
+
+    pos = 0
+    for a, b in zip(starts, stops):
+        yield from x[pos:a].tolist()
+
+        start, anchor = a, x[a]
+        while True:
+            stop = min(start + window - 1, b)
+            seg = x[start:stop + 1].copy()
+            seg[0] = anchor
+            key = seg.tobytes()
+            res = cache.get(key) if cache is not None else None
+            if res is None:
+                __check_cancelled(cancel)
+                res = smoother.smooth(seg)
+                res[0] = anchor
+                if cache is not None:
+                    if len(cache) >= SMOOTH_CACHE_SIZE:
+                        cache.clear()
+                    cache[key] = res
+            if stop == b:
+                yield from res[:-1].tolist()
+                yield x[b].tolist()
+                break
+            yield from res[:window - overlap].tolist()
+            start, anchor = start + window - overlap, res[window - overlap]
+        pos = b + 1
+
+    yield from x[pos:].tolist()
+
+
 def stitch_path(*args):
     full_path = list()
     for p in args:
         full_path.extend(p)
     return full_path
 
+def __coverage_for_angle(coverage_polygon, holes, ft, mode, angle):
+    """
+    Строит маршрут покрытия для одного угла.
+
+    Returns:
+        (длина, координаты маршрута) или None, если построить не удалось
+    """
+    try:
+        polygon = AreaPolygon(coverage_polygon, coverage_polygon[0], interior=holes, ft=ft, angle=angle)
+        ll = polygon.get_area_coverage(mode=mode)
+        return ll.length, list(ll.coords)
+    except Exception:
+        return None
+
+
+def __coverage_cost(perimeter, start_point, exit_point, coverages, angle):
+    """
+    Стоимость маршрута покрытия из coverages[angle]
+    (длина покрытия + переезды по кругу от старта и до выхода).
+
+    Args:
+        perimeter: PerimeterIndex круга, по которому выполняются переезды
+
+    Returns:
+        (стоимость, угол, координаты маршрута) или None, если маршрута нет
+    """
+    if coverages[angle] is None:
+        return None
+    length, coords = coverages[angle]
+    try:
+        start_path_on_cp = perimeter.nearest_point(coords[0])
+        end_path_on_cp = perimeter.nearest_point(coords[-1])
+
+        l1 = perimeter.distance_between(start_point, start_path_on_cp)
+        l2 = perimeter.distance_between(end_path_on_cp, exit_point)
+
+        return length + l1 + l2, angle, coords
+    except Exception:
+        return None
+
+
+def __map_coverages(coverage, coverages, workers, cancel, evaluate, angles):
+    """
+    Строит маршруты покрытия для углов, которых еще нет в coverages
+    (в пуле процессов, см. __map_angles), и отдает evaluate(angle)
+    для всех углов по порядку.
+    """
+    angles = list(angles)
+    new = __map_angles(coverage, [a for a in angles if a not in coverages], workers, cancel)
+    for angle in angles:
+        if angle not in coverages:
+            coverages[angle] = next(new)
+        yield evaluate(angle)
+
+
+def __evaluate_chunk(evaluate, angles):
+    return [evaluate(angle) for angle in angles]
+
+
+def __map_angles(evaluate, angles, workers=SWEEP_WORKERS, cancel=None):
+    """
+    Считает evaluate для каждого угла в пуле процессов и отдает результаты
+    по мере готовности, сохраняя порядок углов.
+    При workers == 1 или если пул недоступен - считает последовательно.
+    Между результатами проверяется cancel (см. __check_cancelled).
+    """
+    angles = list(angles)
+    __check_cancelled(cancel)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(angles))
+
+    done = 0
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(angles) // (workers * 4))
+                # задачи по частям углов; невыполненные части отменяются
+                # при отмене расчета (shutdown(cancel_futures=...) - только с Python 3.9)
+                futures = [pool.submit(__evaluate_chunk, evaluate, angles[i:i + chunksize])
+                           for i in range(0, len(angles), chunksize)]
+                try:
+                    for future in futures:
+                        for result in future.result():
+                            if cancel is not None and cancel.is_set():
+                                raise PlanningCancelled()
+                            done += 1
+                            yield result
+                finally:
+                    for future in futures:
+                        future.cancel()
+                return
+        except (OSError, RuntimeError, AssertionError):
+            # нет доступа к процессам (например, внутри процесса-демона)
+            pass
+
+    for angle in angles[done:]:
+        __check_cancelled(cancel)
+        yield evaluate(angle)
+
+
+def __search_angle(evaluate,
+                   lo: float,
+                   hi: float,
+                   num: int,
+                   workers,
+                   debug_data: dict = None,
+                   cancel=None,
+                   on_improve=None,
+                   mapper=None):
+    """
+    Перебирает углы покрытия по равномерной сетке
+    и выбирает угол с минимальной стоимостью.
+
+    Args:
+        evaluate: Функция angle -> (стоимость, угол, данные) или None
+        lo, hi, num: Диапазон углов и количество углов сетки
+        workers: Количество процессов (см. SWEEP_WORKERS)
+        debug_data: Сюда записываются выбранный угол и количество оценок
+        cancel: Флаг отмены (см. __check_cancelled)
+        on_improve: Вызывается с (стоимость, угол, данные) при каждом улучшении
+        mapper: Функция (evaluate, углы) -> результаты
+                (по умолчанию __map_angles с workers и cancel)
+
+    Returns:
+        (стоимость, угол, данные) для лучшего угла
+    """
+    if mapper is None:
+        mapper = partial(__map_angles, workers=workers, cancel=cancel)
+    angle_search = AngleSearch(evaluate,
+                               mapper=mapper,
+                               on_improve=on_improve)
+    best = angle_search.grid(lo, hi, num)
+
+    if debug_data is not None:
+        debug_data['angle'] = best[1]
+        debug_data['evaluations'] = angle_search.evaluations
+    return best
+
+
 def find_best_coverage_path(
     coverage_polygon,
     circle_path,
     start_point,
     exit_point,
-    ft=20
+    ft=20,
+    workers=SWEEP_WORKERS,
+    mode=COVERAGE_MODE,
+    debug_data=None,
+    cancel=None,
+    on_improve=None,
+    coverages=None,
+    holes=()
 ):
-    conf = list()
-    for angle in np.linspace(0.0, 90.0, num=91):
-        try:
-            polygon = AreaPolygon(coverage_polygon, coverage_polygon[0], interior=[], ft=ft, angle=angle)
-            ll = polygon.get_area_coverage()
-
-            start_path = list(ll.coords)[0]
-            end_path = list(ll.coords)[-1]
-
-            start_path_on_cp = nearest_polygon_point(start_path, circle_path)
-            end_path_on_cp = nearest_polygon_point(end_path, circle_path)
-
-
+    """
+    Ищет угол маршрута покрытия от 0 до 90 градусов
+    с минимальной суммарной длиной.
 
-            _, l1 = polygon_perimeter_between_points(start_point,
-                                                    start_path_on_cp,
-                                                    circle_path)
-            _, l2 = polygon_perimeter_between_points(end_path_on_cp,
-                                                    exit_point, 
-                                                    circle_path)
+    Args:
+        circle_path: Круг для переездов (список точек или PerimeterIndex)
+        workers: Количество процессов для перебора (см. SWEEP_WORKERS)
+        mode: Режим покрытия (см. COVERAGE_MODE)
+        debug_data: Сюда записываются выбранный угол ('angle')
+                    и количество построенных маршрутов ('evaluations')
+        cancel: Флаг отмены, проверяется между оценками углов
+        on_improve: Вызывается с (маршрут, первая точка, последняя точка)
+                    лучшего из уже оцененных углов при каждом улучшении
+        coverages: Кэш маршрутов покрытия по углам; маршруты покрытия
+                   не зависят от start_point и exit_point, поэтому при их
+                   изменении пересчитываются только стоимости
+        holes: Препятствия внутри coverage_polygon (список колец)
 
-            conf.append((ll.length + l1 + l2, angle))
-        except:
-            pass
+    Returns:
+        маршрут, его первая и последняя точки
+    """
+    if not isinstance(circle_path, PerimeterIndex):
+        circle_path = PerimeterIndex(circle_path)
+    coverages = {} if coverages is None else coverages
+    coverage = partial(__coverage_for_angle, coverage_polygon, list(holes), ft, mode)
+    evaluate = partial(__coverage_cost, circle_path, start_point, exit_point, coverages)
+    if on_improve is not None:
+        report = lambda result: on_improve(*__coverage_result(result[2]))
+    else:
+        report = None
+    mapper = partial(__map_coverages, coverage, coverages, workers, cancel)
+    _, _, path = __search_angle(evaluate, 0.0, 90.0, 91, workers,
+                                debug_data, cancel, report, mapper)
+    return __coverage_result(path)
 
-    best_angle = sorted(conf)[0][1]
-    polygon = AreaPolygon(coverage_polygon, coverage_polygon[0], interior=[], ft=ft, angle=best_angle)
-    ll = polygon.get_area_coverage()
 
-    path = list(ll.coords)
+def __coverage_result(path):
+    """Маршрут покрытия без последней точки, его первая и последняя точки."""
     path = path[: len(path) - 1]
-
     return path, path[0], path[-1]
 
 
-def find_best_config(coverage_polygon, ft=20):
-    conf = list()
-    for angle in np.linspace(-90.0, 90.0, num=90):
-        polygon = AreaPolygon(coverage_polygon, coverage_polygon[0], interior=[], ft=ft, angle=angle)
-        ll = polygon.get_area_coverage()
-        conf.append((ll.length, angle))
-
-    best_angle = sorted(conf)[0][1]
-    polygon = AreaPolygon(coverage_polygon, coverage_polygon[0], interior=[], ft=ft, angle=best_angle)
+def __evaluate_config_angle(coverage_polygon, ft, angle):
+    polygon = AreaPolygon(coverage_polygon, coverage_polygon[0], interior=[], ft=ft, angle=angle)
     ll = polygon.get_area_coverage()
+    return ll.length, angle, ll
+
+
+def find_best_config(coverage_polygon, ft=20, debug_data=None):
+    evaluate = partial(__evaluate_config_angle, coverage_polygon, ft)
+    _, _, ll = __search_angle(evaluate, -90.0, 90.0, 90, 1, debug_data=debug_data)
 
     path = list(zip(ll.xy))
     path = path[: len(path) - 2]
@@ -511,8 +890,7 @@ def write_path_to_json(
         path: t.List[t.Tuple[float, float]],
         filename: str = 'path.json'
 ):
-    with open(filename, 'w') as f:
-        json.dump(path, f, ensure_ascii=False)
+    write_json(filename, path)
 
 
 # test
@@ -1,29 +1,43 @@
-from PyQt5.QtCore import Qt, QMargins, QObject, pyqtSignal, QRunnable, QThreadPool
+import os
+import threading
+import traceback
+
+from PySide2.QtCore import Qt, QMargins, QObject, Signal, QRunnable, QThreadPool
 from mapObjects import Polygon, TractorPath
 
 from utm import Converter
 from test_cov_plan import build_path
-import shapefile
-from shapefile import Writer
 
 
 import constants as const
-from border_path import build_path2
+from border_path import PlanningCancelled
+from perimeter import invalidate
+from planning import TASKS, border_steps, PlanningSession
+from plan_cache import PlanCache, plan_key
+from export import FORMATS, export_tracks, tracks_to_wgs
+
+
+# Процессов перебора углов на одну работу: работы уже считаются
+# параллельно в потоках, а пул процессов, порожденный (fork) из
+# многопоточного процесса Qt, небезопасен
+SWEEP_WORKERS = 1
 
 
 
 class Model(QObject):
-    geometryLoaded = pyqtSignal()
-    pointsChanged = pyqtSignal()
-    seedingPathChanged = pyqtSignal()
-    sprinklingPathChanged = pyqtSignal()
-    startLongOperation = pyqtSignal()
-    longOperationFinished = pyqtSignal()
+    geometryLoaded = Signal()
+    pointsChanged = Signal()
+    seedingPathChanged = Signal()
+    sprinklingPathChanged = Signal()
+    startLongOperation = Signal()
+    longOperationFinished = Signal()
 
     def __init__(self):
         super().__init__()
 
         self.givenGeometry = None
+        # Преобразование координат загруженного поля (для экспорта в WGS84)
+        self.converter = None
         self.tractorPathSeeding = None
         self.tractorPathSprinkling = None
 
@@ -40,6 +54,18 @@ class Model(QObject):
         self.entryPoint = None
         self.endPoint = None
 
+        # Расчет маршрутов в фоне: сев и полив считаются параллельно
+        self.threadPool = QThreadPool()
+        self.threadPool.setMaxThreadCount(max(len(TASKS), self.threadPool.maxThreadCount()))
+        self.job = 0
+        self.cancelEvent = None
+        self.workers = {}
+        # Сеансы планирования по работам: при перемещении точек
+        # пересчитываются только переезды и выбор угла
+        self.sessions = {}
+        # Готовые маршруты на диске
+        self.planCache = PlanCache()
+
 
     def pullGeometryFromFile(self, filename):
         try:
@@ -49,29 +75,51 @@ class Model(QObject):
             print(e)
             return
         self.givenGeometry = Polygon()
+        self.converter = converter
 
         for p in converter.get_cartesian():
             self.givenGeometry.addPoint(p)
+        # Список точек изменен на месте - сбросить подготовленную геометрию
+        invalidate(self.givenGeometry.points)
+        self.cancelCalculation()
+        self.sessions = {}
 
         self.geometryLoaded.emit()
 
-    def exportF(self):
-        print("SHOULD EXPORT")
-        poly = self.tractorPathSeeding.points
-        with shapefile.Writer("export_data.shp", shapefile.POLYGON) as shp:
-            shp.field('Track', 'C')
-
-            shp.poly([poly])
-            shp.record('Seeding')
+    def exportF(self, filename, formats=FORMATS):
+        """
+        Записывает рассчитанные маршруты сева и полива в WGS84
+        во все форматы formats (см. export); filename - путь без расширения
+        или с расширением одного из форматов.
+        """
+        paths = {'seeding': self.tractorPathSeeding, 'sprinkling': self.tractorPathSprinkling}
+        paths = {task: path.points for task, path in paths.items() if path is not None and path.points}
+        if self.converter is None or not paths:
+            print("Nothing to export: calculate the paths first")
+            return []
+        try:
+            files = export_tracks(os.path.splitext(filename)[0], tracks_to_wgs(self.converter, paths), formats)
+        except (OSError, ValueError) as e:
+            print("Export error: {}".format(e))
+            return []
+        print("Exported: {}".format(', '.join(files)))
+        return files
 
 
     def setEntryPoint(self, point):
         self.entryPoint = point
         self.pointsChanged.emit()
+        self.replan()
 
     def setEndPoint(self, point):
         self.endPoint = point
         self.pointsChanged.emit()
+        self.replan()
+
+    def replan(self):
+        """Пересчитывает маршруты после перемещения точек, если они уже были рассчитаны."""
+        if self.sessions and self.entryPoint is not None and self.endPoint is not None:
+            self.calculate()
 
     def createTestData(self):
         path = build_path(
@@ -87,63 +135,163 @@ class Model(QObject):
             self.seedingPathChanged.emit()
             print('can draw')
 
+    def isCalculating(self):
+        return bool(self.workers)
+
     def calculate(self):
-        print('core will calculate')
-        # self.createTestData()
+        """
+        Запускает расчет маршрутов сева и полива в пуле потоков.
+        Предыдущий незавершенный расчет отменяется.
+        """
+        if self.givenGeometry is None or self.entryPoint is None or self.endPoint is None:
+            print("Load the field and set entry and end points first")
+            return
 
-        # when finish calculating, call:
-        # self.seedingPathChanged.emit()
-        # self.sprinklingPathChanged.emit()
-        # this will let me know that geometry is ready to be displayed
+        self.cancelCalculation()
+        self.job += 1
+        self.cancelEvent = threading.Event()
+        steps = border_steps(self.seederWidth, self.rowWidth)
+        for task in TASKS:
+            session = self.sessions.get(task)
+            if session is None or session.border_step != steps[task]:
+                self.sessions[task] = PlanningSession(self.givenGeometry.points, steps[task],
+                                                      holes=self.converter.holes)
+
+        keys = {}
+        for task in TASKS:
+            session = self.sessions[task]
+            keys[task] = plan_key(session.border, self.entryPoint, self.endPoint,
+                                  session.border_step, session.params, self.machineWidths(),
+                                  session.holes)
+            path = self.planCache.get(keys[task])
+            if path:
+                self.setTaskPath(task, path)
+                del keys[task]
+        if not keys:
+            return
 
-    def doLongWork(self):
-        # create thread and worker
-        self.threadPool = QThreadPool()
+        self.startLongOperation.emit()
+        for task in keys:
+            worker = CalcWorker(job=self.job,
+                                task=task,
+                                session=self.sessions[task],
+                                entryPoint=tuple(self.entryPoint),
+                                endPoint=tuple(self.endPoint),
+                                params={'cancel': self.cancelEvent,
+                                        'sweep_workers': SWEEP_WORKERS},
+                                cache=self.planCache,
+                                key=keys[task])
+            worker.signals.progress.connect(self.onPathProgress)
+            worker.signals.finished.connect(self.onPathCalculated)
+            worker.signals.failed.connect(self.onCalculationFailed)
+            worker.signals.cancelled.connect(self.onCalculationCancelled)
+            self.workers[task] = worker
+            self.threadPool.start(worker)
+
+    def machineWidths(self):
+        """Параметры техники, входящие в ключ кэша маршрутов."""
+        return {
+            'tractorWidth': self.tractorWidth,
+            'tractorWheelBase': self.tractorWheelBase,
+            'seederWidth': self.seederWidth,
+            'sprinklerWidth': self.sprinklerWidth,
+            'rowWidth': self.rowWidth,
+            'turnRadius': self.turnRadius,
+        }
+
+    def cancelCalculation(self):
+        """Отменяет текущий расчет; результаты отмененных работ игнорируются."""
+        if self.cancelEvent is not None:
+            self.cancelEvent.set()
+        if self.workers:
+            self.workers.clear()
+            self.longOperationFinished.emit()
+
+    def setTaskPath(self, task, path):
+        if task == 'seeding':
+            self.tractorPathSeeding = TractorPath(points=path)
+            self.seedingPathChanged.emit()
+        else:
+            self.tractorPathSprinkling = TractorPath(points=path)
+            self.sprinklingPathChanged.emit()
 
-        self.worker = HalCommunicatorWorker(core=self.core)
-        self.killed.connect(self.worker.killMe)
+    def onPathProgress(self, job, task, stage, path):
+        # промежуточный маршрут (см. build_path2, параметр 'progress')
+        if job != self.job or task not in self.workers or not path:
+            return
+        self.setTaskPath(task, path)
+
+    def onPathCalculated(self, job, task, path):
+        if job != self.job:
+            return
+        self.setTaskPath(task, path)
+        self.finishTask(task)
+
+    def onCalculationFailed(self, job, task, message):
+        if job != self.job:
+            return
+        print("Calculation of {} path failed: {}".format(task, message))
+        self.finishTask(task)
+
+    def onCalculationCancelled(self, job, task):
+        if job != self.job:
+            return
+        self.finishTask(task)
+
+    def finishTask(self, task):
+        if self.workers.pop(task, None) is not None and not self.workers:
+            self.longOperationFinished.emit()
 
 
 class WorkerSignals(QObject):
-    begin = pyqtSignal()
-    end = pyqtSignal()
+    # (номер расчета, работа, этап, промежуточный маршрут)
+    progress = Signal(int, str, str, object)
+    # (номер расчета, работа, маршрут)
+    finished = Signal(int, str, object)
+    # (номер расчета, работа, сообщение об ошибке)
+    failed = Signal(int, str, str)
+    # (номер расчета, работа)
+    cancelled = Signal(int, str)
 
 
 class CalcWorker(QRunnable):
-    def __init__(self):
+    """
+    Расчет маршрута одной работы (сев или полив) в пуле потоков.
+    Сеанс планирования хранит копию границы поля, поэтому изменения
+    модели во время расчета на работника не влияют.
+    """
+
+    def __init__(self, job, task, session, entryPoint, endPoint, params, cache=None, key=None):
         super().__init__()
         self.signals = WorkerSignals()
-        self.signals.begin.emit()
+        self.job = job
+        self.task = task
+        self.session = session
+        self.entryPoint = entryPoint
+        self.endPoint = endPoint
+        self.params = dict(params)
+        self.params['progress'] = self.reportProgress
+        # Кэш готовых маршрутов (PlanCache) и ключ маршрута в нем
+        self.cache = cache
+        self.key = key
+
+    def reportProgress(self, stage, path):
+        if stage != 'final':
+            self.signals.progress.emit(self.job, self.task, stage, list(path))
 
     def run(self):
-        pass
-        # do work here
-
-        # work finished
-        self.signals.end.emit()
-
-        seeder_border_step = self.seederWidth / 2 + 0.05  # пол ширины сеялки + 5 см запас
-        # seeder_path = build_path2(
-        #     border=self.givenGeometry.points,
-        #     entry_point=self.entryPoint,
-        #     exit_point=self.endPoint,
-        #     border_step=seeder_border_step,
-        #     params={},
-        #     debug_data={},
-        # )
-
-        sprinkler_border_step = seeder_border_step + 5 * self.rowWidth  # +5 рядов к отступу сеялки
-        sprinkler_path = build_path2(
-            border=self.givenGeometry.points,
-            entry_point=self.entryPoint,
-            exit_point=self.endPoint,
-            border_step=sprinkler_border_step,
-            params={},
-            debug_data={},
-        )
-
-        # self.tractorPathSeeding = TractorPath(points=seeder_path)
-        # self.seedingPathChanged.emit()
-
-        self.tractorPathSprinkling = TractorPath(points=sprinkler_path)
-        self.sprinklingPathChanged.emit()
+        try:
+            path = self.session.plan(self.entryPoint, self.endPoint, self.params)
+        except PlanningCancelled:
+            self.signals.cancelled.emit(self.job, self.task)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(self.job, self.task, str(e))
+        else:
+            self.signals.finished.emit(self.job, self.task, path)
+            if self.cache is not None and path:
+                try:
+                    self.cache.put(self.key, path)
+                except Exception:
+                    # кэш не должен влиять на результат расчета
+                    traceback.print_exc()
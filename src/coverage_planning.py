@@ -1,10 +1,10 @@
 from shapely.geometry import Point, Polygon, LinearRing, LineString
 from shapely.geometry import MultiLineString, MultiPoint, GeometryCollection
-from shapely.geos import TopologicalError
 import numpy as np
-from logging import error
 from math import atan
 
+from swaths import tolerance, ring_edges, segments_entering, ring_detour, scanline_segments, order_segments, decompose_cells, cell_paths, order_cells
+
 def cmp(a, b):
     return (a > b) - (a < b) 
 
@@ -14,10 +14,10 @@ class Rtf:
     def __init__(self, angle):
         self.angle = angle
         self.w = np.radians(90 - self.angle)
-        self.irm = np.mat([[np.cos(self.w), -np.sin(self.w), 0.0],
-                           [np.sin(self.w), np.cos(self.w),  0.0],
-                           [0.0,         0.0,          1.0]])
-    
+        self.rm = np.array([[np.cos(self.w), -np.sin(self.w)],
+                            [np.sin(self.w), np.cos(self.w)]])
+        self.irm = self.rm.T
+
 
 class AreaPolygon:
     """Polygon object definition for area coverage path planning"""
@@ -55,140 +55,165 @@ class AreaPolygon:
 
     def rotate_points(self, points):
         """Applies rtf to polygon coordinates"""
-        new_points = []
-        for point in points:
-            point_mat = np.mat([[point[0]],[point[1]],[0]], dtype='float64')
-            new_point = self.rtf.irm * point_mat
-            new_points.append(np.array(new_point[:-1].T, dtype='float64'))
-        return np.squeeze(np.array(new_points, dtype='float64'))
+        points = np.asarray(points, dtype='float64')[:, :2]
+        return np.squeeze(points @ self.rtf.rm.T)
 
     def rotate_from(self, points):
         """Rotate an ndarray of given points(x,y) from a given rotation"""
         if type(points) != np.ndarray:
             raise TypeError("rotate_from: takes an numpy.ndarray")
-        new_points = []
-        for point in points:
-            point_mat = np.mat([[point[0]],[point[1]],[0]], dtype='float64')
-            new_point = self.rtf.irm.I * point_mat
-            new_points.append(np.array(new_point[:-1].T, dtype='float64'))
-        return np.squeeze(np.array(new_points, dtype='float64'))
+        points = points.astype('float64')[:, :2]
+        return np.squeeze(points @ self.rtf.irm.T)
 
     def rotated_polygon(self):
         """Applies rtf to polygon and holes (if any)"""
-        points = np.array(self.P.exterior)
+        points = np.asarray(self.P.exterior.coords)
         tf_points = self.rotate_points(points)
         tf_holes = []
         for hole in self.P.interiors:
-            tf_holes.append(self.rotate_points(np.array(hole)))
+            tf_holes.append(self.rotate_points(np.asarray(hole.coords)))
         return self.array2polygon(tf_points, tf_holes)
 
     def array2polygon(self, points, holes):
-        new_exterior = []
-        new_interior = []
-        
-        # Exterior
-        for point in points:
-            new_exterior.append((float(point[0]),float(point[1])))
-            
-        # Interior
-        for hole in holes:
-            new_hole = []
-            for p in hole:
-                new_hole.append((float(p[0]), float(p[1])))
-            new_interior.append(new_hole)
-        return Polygon(new_exterior, new_interior)
+        return Polygon(points, [np.asarray(hole) for hole in holes])
+
+    def swath_offsets(self):
+        """x coordinates of the swaths in the rotated frame"""
+        minx, maxx = self.rP.bounds[0], self.rP.bounds[2]
+        iterations = int((maxx - minx) / self.ft) + 2
+        return minx + np.arange(iterations) * self.ft
+
+    def rotated_rings(self):
+        return [self.rP.exterior.coords] + [hole.coords for hole in self.rP.interiors]
+
+    def generate_segments(self):
+        """
+        Parallel coverage swaths as arrays: (m, 2, 2) segment end points,
+        (m,) swath index of every segment and the origin of the path
+        """
+        segments, swath = scanline_segments(self.rotated_rings(), self.swath_offsets(), keep_empty=True)
+
+        # The starting swath runs upwards, the offset ones downwards
+        # (as parallel_offset(..., 'right') of the starting line did)
+        offset = swath > 0
+        segments[offset] = segments[offset, ::-1]
+        order = np.lexsort((np.where(offset, -1.0, 1.0) * segments[:, 0, 1], swath))
+        segments, swath = segments[order], swath[order]
+
+        # Origin: first point of the first offset swath
+        found = np.flatnonzero(offset[order])
+        found_line = tuple(segments[found[0], 0]) if found.size else None
+
+        nonempty = np.abs(segments[:, 1, 1] - segments[:, 0, 1]) > tolerance(self.rotated_rings())
+        return segments[nonempty], swath[nonempty], found_line
 
     def generate_path(self):
         """Generate parallel coverage path lines"""
-        starting_breakdown = self.rP.bounds[0:2]  # poly.bounds = bounding box
-        line = LineString([starting_breakdown, (starting_breakdown[0],
-                                                starting_breakdown[1] +
-                                                self.rP.bounds[3] - self.rP.bounds[1])])
-
-        # print('Linestring', self.rP.intersection(line).coords[0])
-        try:
-            bounded_line = self.rP.intersection(line)
-        except TopologicalError as e:
-            error("Problem looking for intersection.", exc_info=1)
-            return
-        
-        lines = [bounded_line]
-
-        found_line = None
-
-#         iterations = int(ceil((self.rP.bounds[2] - self.rP.bounds[0]) / ft)) + 1
-        iterations = int((self.rP.bounds[2] - self.rP.bounds[0]) / self.ft) + 2
-        for x in range(1, iterations):
-            bounded_line = line.parallel_offset(x * self.ft, 'right')
-            if self.rP.intersects(bounded_line):
-                if found_line is None:
-                    found_line = self.rP.intersection(bounded_line)
-                try:
-                    bounded_line = self.rP.intersection(bounded_line)
-                except TopologicalError as e:
-                    error("Problem looking for intersection.", exc_info=1)
-                    continue
-                lines.append(bounded_line)
-        # print(list(found_line.coords))
-        # print(found_line)
-        if isinstance(found_line, MultiLineString):
-            found_line = found_line.geoms[0]
-            # print(found_line.geoms[0])
-
-        return lines, found_line.coords[0]
-
-    def sort_points(self, point, liste):
-        "Sorts a set of points by distance to a point"
-        liste.sort(key=lambda x: x.distance(Point(*point)))
-        return liste
+        segments, swath, found_line = self.generate_segments()
+        lines = []
+        for parts in np.split(segments, np.flatnonzero(np.diff(swath)) + 1):
+            if len(parts) == 1:
+                lines.append(LineString(parts[0]))
+            elif len(parts) > 1:
+                lines.append(MultiLineString(list(parts)))
 
-    def get_furthest_point(self, ps, origin):
-        "Get a point along a line furthest away from a given point"
-        orig_point = Point(*origin)
-        return sorted(ps, key=lambda x: orig_point.distance(Point(*x)))
+        return lines, found_line
 
+    def get_furthest_point(self, ps, origin):
+        "Sort the points by distance to a given point (the furthest one is the last)"
+        points = np.asarray(list(ps), dtype='float64')
+        origin = np.asarray(origin, dtype='float64').reshape(-1)[:2]
+        distance = np.hypot(*(points[:, :2] - origin).T)
+        return [tuple(p) for p in points[np.argsort(distance, kind='stable')]]
 
     def order_points(self, lines, initial_origin):
         "Return a list of points in a given coverage path order"
-        origin = initial_origin
-        results = []
-        while True:
-            if not len(lines):
-                break
-            self.sort_points(origin, lines)
-            f = lines.pop(0)
-            if type(f) == GeometryCollection:
-                continue
-            if type(f) == MultiLineString:
-                for ln in f:
-                    lines.append(ln)
-                continue
-            if type(f) == Point or type(f) == MultiPoint:
+        segments, swath = [], []
+        for i, line in enumerate(lines):
+            if type(line) == MultiLineString:
+                parts = line.geoms
+            elif type(line) == LineString:
+                parts = [line]
+            else:
                 continue
-            xs, ys = f.xy
-            ps = zip(xs, ys)
-            (start, end) = self.get_furthest_point(ps, origin) # determine direction of path (which of the 2 coordinates is closest to the previous endpoint)
-            results.append(origin)
-            # results.append(start)
-            results.append(start)
-            # results.append(end)
-            origin = end
-        return results
+            for part in parts:
+                segments.append(np.array(part.coords)[[0, -1], :2])
+                swath.append(i)
+        return order_segments(segments, swath, initial_origin).tolist()
 
     # NOTE: the decomposition of the area will depend on the robot's footprint
     def boustrophedon_decomposition(self, origin):
         """Decompose polygon area according to Boustrophedon area path planning algorithm"""
-        p, orig = self.generate_path()
+        segments, swath, orig = self.generate_segments()
         origin = orig
         # print("generetad path", origin)
-        return self.order_points(p, origin)
+        return order_segments(segments, swath, origin)
 
-    def get_area_coverage(self, origin=None):
+    def cell_decomposition(self, origin):
+        """
+        Split the area into boustrophedon cells at the critical points
+        (holes, concavities), sweep every cell separately and order the cells
+        by the shortest transits from origin
+        """
+        segments, swath, _ = self.generate_segments()
+        cells = decompose_cells(segments, swath)
+        return order_cells([cell_paths(segments[cell]) for cell in cells], origin)
+
+    def detour_holes(self, points):
+        """
+        Replaces the parts of the straight transits crossing the holes
+        with the shorter way around along the hole boundary
+        (points and holes in the rotated frame)
+        """
+        holes = [ring_edges([hole.coords]) for hole in self.rP.interiors]
+        if not holes or len(points) < 2:
+            return points
+        eps = tolerance(self.rotated_rings())
+        bounds = np.array([np.hstack([edges[:, :2].min(axis=0), edges[:, :2].max(axis=0)]) for edges in holes])
+        starts = np.asarray(points, dtype='float64')[:-1, :2]
+        ends = np.asarray(points, dtype='float64')[1:, :2]
+        lo, hi = np.minimum(starts, ends), np.maximum(starts, ends)
+        # Transits and holes with overlapping bounding boxes
+        near = ((bounds[None, :, 0] <= hi[:, None, 0]) & (bounds[None, :, 2] >= lo[:, None, 0]) &
+                (bounds[None, :, 1] <= hi[:, None, 1]) & (bounds[None, :, 3] >= lo[:, None, 1]))
+        for i, hole in enumerate(holes):
+            candidates = np.flatnonzero(near[:, i])
+            if candidates.size:
+                near[candidates, i] = segments_entering(hole, starts[candidates], ends[candidates], eps)
+
+        detours = {}
+        for k, i in zip(*np.nonzero(near)):
+            detour = ring_detour(holes[i], starts[k], ends[k], eps)
+            if detour is not None:
+                detours.setdefault(k, []).append(detour)
+        if not detours:
+            return points
+
+        result = [tuple(points[0])]
+        for k, point in enumerate(points[1:]):
+            # Holes in the order along the transit
+            for detour in sorted(detours.get(k, ()), key=lambda d: np.hypot(*(d[0] - starts[k]))):
+                result.extend(detour)
+            result.append(tuple(point))
+        return result
+
+    def get_area_coverage(self, origin=None, mode='boustrophedon'):
+        """
+        mode: 'boustrophedon' - greedy order of all swaths,
+              'cells' - cell decomposition (see cell_decomposition)
+        """
         if origin:
             origin = self.rotate_points(np.array([origin])).tolist()
         else:
             origin = self.rotate_points(np.array([self.origin])).tolist()
-        result = self.boustrophedon_decomposition(origin)
+        if mode == 'boustrophedon':
+            result = self.boustrophedon_decomposition(origin)
+        elif mode == 'cells':
+            result = self.cell_decomposition(origin)
+        else:
+            raise ValueError("Unknown coverage mode: {}".format(mode))
+        if self.rP.interiors:
+            result = self.detour_holes(result)
         tf_result = self.rotate_from(np.array(result))
         return LineString(tf_result)
 
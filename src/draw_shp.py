@@ -1,20 +1,15 @@
 import sys
-import shapefile
 import matplotlib.pyplot as plt
 
+from shp_reader import ShapeFileMap
 
-if __name__ == '__main__':
-    sf = shapefile.Reader(sys.argv[1])
-    feature = sf.shapeRecords()[0]
-    first = feature.shape.__geo_interface__ 
-    polygon = first['coordinates'] if isinstance(first['coordinates'], list) else first['coordinates'][0]
-    print(polygon) # (GeoJSON format)
-
-    x, y = list(), list()
 
-    for p in polygon:
-        x.append(p[0])
-        y.append(p[1])
+if __name__ == '__main__':
+    with ShapeFileMap(sys.argv[1]) as shp:
+        for i, rings in shp.iter_rings():
+            for ring in rings:
+                plt.plot(ring[:, 0], ring[:, 1])
+        print('{} records'.format(len(shp)))
 
-    plt.plot(x, y)
+    plt.axis('equal')
     plt.show()
@@ -0,0 +1,311 @@
+"""
+Экспорт маршрутов (треков сева и полива) в WGS84.
+
+Форматы (FORMATS):
+    'shp' - shapefile POLYLINE (POLYLINEZ, если у точек есть высота),
+            одна запись на трек, поле Track - имя трека;
+    'geojson' - FeatureCollection из LineString, записывается потоком
+                по частям трека;
+    'bin' - компактный двоичный формат для терминала трактора:
+            первая точка трека в float64, остальные - разности
+            соседних точек в float32 (см. write_binary).
+
+Треки передаются словарем {имя: массив n x 2 (долгота, широта)
+или n x 3 (долгота, широта, высота)}; точки записываются из массивов
+целиком, без цикла Python по точкам.
+"""
+import os
+import json
+import struct
+import typing as t
+from collections import OrderedDict
+
+import numpy as np
+import shapefile
+
+from shp_reader import HEADER_BYTES, Z_TYPES
+
+
+FORMATS = ('shp', 'geojson', 'bin')
+
+# Расширения файлов форматов
+EXTENSIONS = {'shp': '.shp', 'geojson': '.geojson', 'bin': '.tsp'}
+
+# Описание WGS84 для .prj
+WGS84_WKT = ('GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],'
+             'PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]')
+
+# Типы фигур shapefile
+POLYLINE = 3
+POLYGON = 5
+POLYLINEZ = 13
+POLYGONZ = 15
+
+# Длина поля Track в .dbf
+TRACK_FIELD_SIZE = 50
+
+# Знаков после запятой в GeoJSON (1e-8 градуса - около 1 мм)
+GEOJSON_PRECISION = 8
+
+# Знаков после запятой в write_json (None - без округления,
+# кратчайшая запись, точно восстанавливающая число, как у json.dump)
+JSON_PRECISION = None
+
+# Точек в одной записываемой части JSON и GeoJSON
+GEOJSON_CHUNK = 65536
+
+# Заголовок двоичного формата: сигнатура, версия, флаги, количество треков
+BINARY_MAGIC = b'TSPB'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sBBH')
+# Флаг: у точек есть высота
+BINARY_HAS_Z = 1
+
+Tracks = t.Dict[str, np.ndarray]
+
+
+def __as_tracks(tracks) -> Tracks:
+    """Треки как массивы float64 одной размерности (2 или 3 столбца)."""
+    result = OrderedDict((str(name), np.asarray(points, dtype='float64')) for name, points in tracks.items())
+    dims = {points.shape[1] for points in result.values() if points.ndim == 2}
+    if any(points.ndim != 2 or len(points) < 2 for points in result.values()) or \
+            len(dims) > 1 or not dims <= {2, 3}:
+        raise ValueError("Tracks must be arrays of at least two points with the same "
+                         "number of coordinates (2 or 3)")
+    return result
+
+
+def __shp_header(shape_type, file_bytes, bbox, zrange):
+    """Заголовок .shp/.shx (100 байт)."""
+    header = bytearray(HEADER_BYTES)
+    struct.pack_into('>i', header, 0, 9994)
+    struct.pack_into('>i', header, 24, file_bytes // 2)
+    struct.pack_into('<2i', header, 28, 1000, shape_type)
+    struct.pack_into('<4d', header, 36, *bbox)
+    struct.pack_into('<2d', header, 68, *zrange)
+    return bytes(header)
+
+
+def write_shapes(filename: str,
+                 shape_type: int,
+                 shapes: t.List[t.List[np.ndarray]],
+                 fields: t.List[t.Tuple] = (),
+                 records: t.List[t.List] = ()):
+    """
+    Записывает линии или полигоны в shapefile (.shp, .shx, .dbf, .prj).
+
+    Записи .shp формируются прямо из байтов массивов; через pyshp
+    пишется только .dbf. Для типов с Z - без значений M.
+
+    Args:
+        shape_type: POLYLINE, POLYLINEZ, POLYGON или POLYGONZ
+        shapes: Части каждой фигуры - массивы n x 2 (n x 3 для типов с Z)
+        fields: Поля .dbf, аргументы shapefile.Writer.field: (имя, тип, размер, знаков)
+        records: Значения полей для каждой фигуры
+    """
+    has_z = shape_type in Z_TYPES
+    dims = 3 if has_z else 2
+    body, index = [], []
+    bbox = np.array([np.inf, np.inf, -np.inf, -np.inf])
+    zrange = np.array([np.inf, -np.inf])
+    offset = HEADER_BYTES
+    for number, parts in enumerate(shapes, 1):
+        points = np.concatenate([np.asarray(p, dtype='float64')[:, :dims] for p in parts])
+        starts = np.cumsum([0] + [len(p) for p in parts[:-1]]).astype('<i4')
+        xy = np.ascontiguousarray(points[:, :2], dtype='<f8')
+        box = np.concatenate((xy.min(axis=0), xy.max(axis=0)))
+        bbox = np.concatenate((np.minimum(bbox[:2], box[:2]), np.maximum(bbox[2:], box[2:])))
+        content = [struct.pack('<i4d2i', shape_type, *box, len(parts), len(xy)), starts.tobytes(), xy.tobytes()]
+        if has_z:
+            z = np.ascontiguousarray(points[:, 2], dtype='<f8')
+            zrange = np.array([min(zrange[0], z.min()), max(zrange[1], z.max())])
+            content += [struct.pack('<2d', z.min(), z.max()), z.tobytes()]
+        length = sum(len(c) for c in content)
+        body += [struct.pack('>2i', number, length // 2)] + content
+        index.append((offset // 2, length // 2))
+        offset += 8 + length
+
+    if not index:
+        bbox, zrange = np.zeros(4), np.zeros(2)
+    elif not has_z:
+        zrange = np.zeros(2)
+    base = os.path.splitext(filename)[0]
+    with open(base + '.shp', 'wb') as f:
+        f.write(__shp_header(shape_type, offset, bbox, zrange))
+        f.writelines(body)
+    with open(base + '.shx', 'wb') as f:
+        f.write(__shp_header(shape_type, HEADER_BYTES + 8 * len(index), bbox, zrange))
+        f.write(np.asarray(index, dtype='>i4').reshape((-1, 2)).tobytes())
+    with open(base + '.dbf', 'wb') as dbf:
+        with shapefile.Writer(dbf=dbf) as writer:
+            for field in fields:
+                writer.field(*field)
+            for record in records:
+                writer.record(*record)
+    with open(base + '.prj', 'w') as f:
+        f.write(WGS84_WKT)
+
+
+def write_shapefile(filename: str, tracks: Tracks):
+    """
+    Записывает треки в shapefile: на трек - одна запись POLYLINE
+    (POLYLINEZ для треков с высотой) из одной части, поле Track - имя трека.
+    """
+    tracks = __as_tracks(tracks)
+    has_z = any(points.shape[1] == 3 for points in tracks.values())
+    write_shapes(filename, POLYLINEZ if has_z else POLYLINE, [[points] for points in tracks.values()],
+                 [('Track', 'C', TRACK_FIELD_SIZE)], [[name] for name in tracks])
+
+
+def __coordinates(points, precision):
+    """Части массива координат GeoJSON ('[x,y],[x,y]...') без скобок вокруг."""
+    number = '%r' if precision is None else '%.{}f'.format(precision)
+    point = '[' + ','.join([number] * points.shape[1]) + ']'
+    for start in range(0, len(points), GEOJSON_CHUNK):
+        chunk = points[start:start + GEOJSON_CHUNK]
+        # одна операция форматирования на часть трека
+        yield ','.join([point] * len(chunk)) % tuple(chunk.ravel().tolist())
+
+
+def __write_coordinates(f, points, precision):
+    for k, part in enumerate(__coordinates(points, precision)):
+        if k:
+            f.write(',')
+        f.write(part)
+
+
+def write_json(filename: str, points, precision: int = JSON_PRECISION):
+    """
+    Записывает точки массивом JSON [[x, y], ...] (потоком, как write_geojson).
+
+    Args:
+        precision: Знаков после запятой; None - без округления
+    """
+    points = np.asarray(points, dtype='float64')
+    with open(filename, 'w') as f:
+        f.write('[')
+        if len(points):
+            __write_coordinates(f, points.reshape((len(points), -1)), precision)
+        f.write(']\n')
+
+
+def write_geojson(filename: str, tracks: Tracks, precision: int = GEOJSON_PRECISION):
+    """
+    Записывает треки в GeoJSON (FeatureCollection, свойство task - имя трека).
+    Файл пишется потоком: в памяти одновременно не более GEOJSON_CHUNK точек
+    в виде текста.
+    """
+    tracks = __as_tracks(tracks)
+    with open(filename, 'w') as f:
+        f.write('{"type": "FeatureCollection", "features": [')
+        for i, (name, points) in enumerate(tracks.items()):
+            f.write('{}{{"type": "Feature", "properties": {{"task": {}}}, '
+                    '"geometry": {{"type": "LineString", "coordinates": ['.format(
+                        ', ' if i else '', json.dumps(name)))
+            __write_coordinates(f, points, precision)
+            f.write(']}}')
+        f.write(']}\n')
+
+
+def write_binary(filename: str, tracks: Tracks):
+    """
+    Записывает треки в двоичный формат терминала (little-endian):
+
+        заголовок: b'TSPB', версия (uint8), флаги (uint8, BINARY_HAS_Z),
+                   количество треков (uint16);
+        трек: длина имени (uint16), имя (utf-8), количество точек (uint32),
+              первая точка (float64 x 2 или 3),
+              разности соседних точек (float32 x 2 или 3 на точку).
+
+    Разности в градусах малы, поэтому float32 сохраняет их с точностью
+    около 1e-12 градуса; ошибка накапливается при суммировании, но
+    для треков в миллионы точек остается меньше миллиметра.
+    """
+    tracks = __as_tracks(tracks)
+    dims = next(iter(tracks.values())).shape[1] if tracks else 2
+    with open(filename, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                                   BINARY_HAS_Z if dims == 3 else 0, len(tracks)))
+        for name, points in tracks.items():
+            encoded = name.encode('utf-8')
+            f.write(struct.pack('<H', len(encoded)) + encoded + struct.pack('<I', len(points)))
+            f.write(points[0].astype('<f8').tobytes())
+            f.write(np.diff(points, axis=0).astype('<f4').tobytes())
+
+
+def read_binary(filename: str) -> Tracks:
+    """
+    Читает файл write_binary.
+
+    Returns:
+        {имя: массив float64 n x 2 или n x 3}
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    magic, version, flags, count = BINARY_HEADER.unpack_from(data, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("{} is not a track file of version {}".format(filename, BINARY_VERSION))
+    dims = 3 if flags & BINARY_HAS_Z else 2
+
+    tracks = OrderedDict()
+    offset = BINARY_HEADER.size
+    for _ in range(count):
+        length = struct.unpack_from('<H', data, offset)[0]
+        name = data[offset + 2:offset + 2 + length].decode('utf-8')
+        offset += 2 + length
+        num_points = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        first = np.frombuffer(data, dtype='<f8', count=dims, offset=offset)
+        offset += 8 * dims
+        deltas = np.frombuffer(data, dtype='<f4', count=dims * (num_points - 1), offset=offset)
+        offset += 4 * dims * (num_points - 1)
+
+        points = np.empty((num_points, dims))
+        points[0] = first
+        np.cumsum(deltas.reshape((-1, dims)), axis=0, dtype='float64', out=points[1:])
+        points[1:] += first
+        tracks[name] = points
+    return tracks
+
+
+WRITERS = OrderedDict([
+    ('shp', write_shapefile),
+    ('geojson', write_geojson),
+    ('bin', write_binary),
+])
+
+
+def tracks_to_wgs(field, paths: t.Dict[str, t.Sequence]) -> Tracks:
+    """
+    Переводит маршруты из декартовых координат поля в WGS84
+    (одно преобразование на маршрут).
+
+    Args:
+        field: utm.Field или utm.Converter, из которого получена граница поля
+        paths: {имя: маршрут в координатах get_cartesian}
+    """
+    tracks = OrderedDict()
+    for name, path in paths.items():
+        if path is not None and len(path):
+            tracks[name] = field.to_wgs(np.asarray(path, dtype='float64')[:, :2])
+    return tracks
+
+
+def export_tracks(base: str, tracks: Tracks, formats: t.Iterable[str] = FORMATS) -> t.List[str]:
+    """
+    Записывает треки во все форматы formats.
+
+    Args:
+        base: Путь к файлам без расширения
+
+    Returns:
+        Записанные файлы (основной файл каждого формата)
+    """
+    files = []
+    for fmt in formats:
+        if fmt not in WRITERS:
+            raise ValueError("Unknown export format: {}".format(fmt))
+        filename = base + EXTENSIONS[fmt]
+        WRITERS[fmt](filename, tracks)
+        files.append(filename)
+    return files
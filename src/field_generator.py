@@ -0,0 +1,291 @@
+"""
+Генератор границ полей для нагрузочных и регрессионных проверок планировщика.
+
+Виды полей (KINDS):
+    'convex' - выпуклое поле (вершины на эллипсе),
+    'l_shape' - L-образное поле,
+    'u_shape' - U-образное поле с выступом на дне (как border_3 в border_path),
+    'noisy' - L-образное поле с множеством вершин и шумом GPS,
+    'holes' - выпуклое поле с препятствиями внутри.
+
+Поля задаются в метрах (как Converter.get_cartesian) и записываются
+в shapefile в WGS84 через UTM-проекцию точки ORIGIN.
+Один и тот же seed всегда дает одни и те же поля.
+
+Запуск:
+    python field_generator.py каталог [--kinds convex,noisy] [--count 3]
+                              [--area 500000] [--vertices 200] [--seed 0]
+"""
+import os
+import argparse
+import typing as t
+from collections import OrderedDict
+
+import numpy as np
+import shapefile
+from shapely import geometry
+
+from utm import zone, project_points, unproject_points
+from export import WGS84_WKT
+
+
+KINDS = ('convex', 'l_shape', 'u_shape', 'noisy', 'holes')
+
+# Площадь поля по умолчанию, м^2
+AREA = 250000.0
+
+# Количество вершин внешней границы по умолчанию
+VERTICES = 64
+
+# Среднеквадратичный шум GPS, метры, и длина корреляции шума, вершины
+GPS_NOISE = 0.5
+NOISE_CORRELATION = 5
+
+# Количество препятствий для 'holes' и их доля площади поля
+HOLES = 3
+HOLE_AREA = 0.02
+
+# Точка привязки локальных координат, (долгота, широта)
+ORIGIN = (27.0, 53.2)
+
+# U-образный шаблон (border_3 из border_path)
+U_TEMPLATE = [(0, 0), (0, 100), (20, 100), (30, 60), (40, 100), (60, 100),
+              (60, 0), (40, 10), (40, 40), (20, 40), (20, 10)]
+
+# Сколько раз перегенерировать поле, если граница получилась самопересекающейся
+ATTEMPTS = 20
+
+Ring = t.List[t.Tuple[float, float]]
+
+
+def signed_area(ring) -> float:
+    """Ориентированная площадь кольца (> 0 - против часовой стрелки)."""
+    points = np.asarray(ring, dtype='float64')
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def densify(ring, vertices: int) -> np.ndarray:
+    """
+    Добавляет вершины на ребра (пропорционально длине), чтобы всего
+    их стало vertices. Исходные вершины сохраняются.
+
+    Args:
+        ring: Вершины без повторения первой
+    """
+    points = np.asarray(ring, dtype='float64')
+    edges = np.roll(points, -1, axis=0) - points
+    lengths = np.hypot(edges[:, 0], edges[:, 1])
+    extra = max(vertices - len(points), 0)
+
+    # распределение по наибольшим остаткам
+    share = extra * lengths / lengths.sum()
+    counts = np.floor(share).astype(int)
+    counts[np.argsort(-(share - counts), kind='stable')[:extra - counts.sum()]] += 1
+
+    result = []
+    for p, e, k in zip(points, edges, counts):
+        result.append(p + np.outer(np.arange(k + 1) / (k + 1), e))
+    return np.concatenate(result)
+
+
+def __scale_rotate(points, area, rng):
+    points = points - points.mean(axis=0)
+    points *= np.sqrt(area / abs(signed_area(points)))
+    a = rng.uniform(0, np.pi)
+    rm = np.array([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+    return points @ rm.T
+
+
+def __convex(vertices, rng):
+    t_ = np.sort(rng.uniform(0, 2 * np.pi, max(vertices, 3)))
+    ratio = rng.uniform(1.0, 2.5)
+    return np.column_stack((ratio * np.cos(t_), np.sin(t_)))
+
+
+def __l_shape(vertices, rng):
+    a, b = rng.uniform(0.3, 0.6, 2)
+    ring = [(0, 0), (1, 0), (1, b), (a, b), (a, 1), (0, 1)]
+    return densify(ring, vertices)
+
+
+def __u_shape(vertices, rng):
+    template = np.array(U_TEMPLATE, dtype='float64')
+    jitter = rng.uniform(-3.0, 3.0, template.shape)
+    jitter[[0, 1, 5, 6]] = 0.0  # внешние углы
+    return densify(template + jitter, vertices)
+
+
+def __gps_noise(points, noise, rng):
+    """Коррелированный шум вдоль нормали к границе."""
+    n = len(points)
+    window = np.ones(NOISE_CORRELATION) / np.sqrt(NOISE_CORRELATION)
+    white = rng.normal(0.0, noise, n + NOISE_CORRELATION)
+    shift = np.convolve(white, window, mode='valid')[:n]
+    tangent = np.roll(points, -1, axis=0) - np.roll(points, 1, axis=0)
+    normal = np.column_stack((tangent[:, 1], -tangent[:, 0]))
+    normal /= np.maximum(np.hypot(normal[:, 0], normal[:, 1]), 1e-12)[:, None]
+    return points + shift[:, None] * normal
+
+
+def __holes(exterior, count, area, rng):
+    """count выпуклых препятствий внутри exterior, не касающихся друг друга."""
+    polygon = geometry.Polygon(exterior)
+    size = np.sqrt(HOLE_AREA * area)
+    inner = polygon.buffer(-size)
+    if inner.is_empty:
+        # поле слишком узкое для препятствий (у пустого полигона нет bounds)
+        return []
+    minx, miny, maxx, maxy = inner.bounds
+    holes = []
+    for _ in range(ATTEMPTS * max(count, 1)):
+        if len(holes) == count:
+            break
+        center = rng.uniform((minx, miny), (maxx, maxy))
+        hole = __scale_rotate(__convex(int(rng.integers(6, 16)), rng), HOLE_AREA * area, rng) + center
+        candidate = geometry.Polygon(hole)
+        if inner.contains(candidate) and all(
+                candidate.distance(geometry.Polygon(h)) > size / 2 for h in holes):
+            holes.append(hole)
+    return holes
+
+
+def __orient(points, clockwise: bool) -> Ring:
+    """Замкнутое кольцо нужной ориентации."""
+    points = np.asarray(points, dtype='float64')
+    if (signed_area(points) < 0) != clockwise:
+        points = points[::-1]
+    ring = [tuple(p) for p in points.tolist()]
+    return ring + ring[:1]
+
+
+def generate_field(kind: str,
+                   area: float = AREA,
+                   vertices: int = VERTICES,
+                   seed: int = 0,
+                   holes: int = HOLES,
+                   noise: float = GPS_NOISE) -> t.Tuple[Ring, t.List[Ring]]:
+    """
+    Генерирует одно поле.
+
+    Args:
+        kind: Вид поля из KINDS
+        area: Площадь внешней границы, м^2
+        vertices: Количество вершин внешней границы (для шаблонов не меньше
+                  количества их углов)
+        seed: Зерно генератора случайных чисел
+        holes: Количество препятствий для 'holes'
+        noise: Шум GPS для 'noisy', метры
+
+    Returns:
+        (внешняя граница по часовой стрелке,
+         [препятствия против часовой стрелки]), кольца замкнуты, метры
+    """
+    if kind not in KINDS:
+        raise ValueError("Unknown field kind: {}".format(kind))
+    rng = np.random.default_rng(seed)
+
+    for _ in range(ATTEMPTS):
+        if kind in ('convex', 'holes'):
+            points = __convex(vertices, rng)
+        elif kind == 'u_shape':
+            points = __u_shape(vertices, rng)
+        else:
+            points = __l_shape(vertices, rng)
+        points = __scale_rotate(points, area, rng)
+        if kind == 'noisy':
+            points = __gps_noise(points, noise, rng)
+        if geometry.Polygon(points).is_valid:
+            break
+    else:
+        raise ValueError("Could not generate a valid {} field".format(kind))
+
+    inner = __holes(points, holes, area, rng) if kind == 'holes' else []
+    return __orient(points, clockwise=True), [__orient(h, clockwise=False) for h in inner]
+
+
+def generate_fields(kinds: t.Iterable[str] = KINDS,
+                    count: int = 1,
+                    seed: int = 0,
+                    **kwargs) -> t.Dict[str, t.Tuple[Ring, t.List[Ring]]]:
+    """
+    count полей каждого вида.
+
+    Args:
+        kwargs: Параметры generate_field (area, vertices, holes, noise)
+
+    Returns:
+        {'<вид>_<номер>': (внешняя граница, препятствия)}
+    """
+    fields = OrderedDict()
+    for k, kind in enumerate(kinds):
+        for i in range(count):
+            fields['{}_{}'.format(kind, i)] = generate_field(kind, seed=seed + 1000 * k + i, **kwargs)
+    return fields
+
+
+def to_wgs(rings: t.List[Ring], origin: t.Tuple[float, float] = ORIGIN) -> t.List[Ring]:
+    """Переводит кольца из метров относительно origin в (долгота, широта)."""
+    z = zone(origin)
+    offset = project_points([origin], z)[0]
+    return [[tuple(p) for p in unproject_points(np.asarray(ring, dtype='float64') + offset, z).tolist()]
+            for ring in rings]
+
+
+def write_shapefile(filename: str,
+                    fields: t.Dict[str, t.Tuple[Ring, t.List[Ring]]],
+                    origin: t.Tuple[float, float] = ORIGIN):
+    """
+    Записывает поля полигонами WGS84 (одна запись на поле, поле FieldName).
+    Поля располагаются рядом друг с другом к востоку от origin.
+    """
+    with shapefile.Writer(filename, shapefile.POLYGON) as shp:
+        shp.field('FieldName', 'C', size=41)
+        offset = 0.0
+        for name, (exterior, holes) in fields.items():
+            points = np.asarray(exterior)
+            shift = np.array([offset - points[:, 0].min(), 0.0])
+            rings = [np.asarray(r) + shift for r in [exterior] + holes]
+            shp.poly(to_wgs(rings, origin))
+            shp.record(name)
+            offset += np.ptp(points[:, 0]) + 100.0
+    with open(os.path.splitext(filename)[0] + '.prj', 'w') as f:
+        f.write(WGS84_WKT)
+
+
+def write_field_files(directory: str, fields, origin=ORIGIN) -> t.Dict[str, str]:
+    """
+    Записывает каждое поле в отдельный <имя>.shp (как читает Converter).
+
+    Returns:
+        {имя поля: файл}
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = OrderedDict()
+    for name, field in fields.items():
+        files[name] = os.path.join(directory, name + '.shp')
+        write_shapefile(files[name], {name: field}, origin)
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic field boundaries')
+    parser.add_argument('directory')
+    parser.add_argument('--kinds', default=','.join(KINDS))
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--area', type=float, default=AREA)
+    parser.add_argument('--vertices', type=int, default=VERTICES)
+    parser.add_argument('--holes', type=int, default=HOLES)
+    parser.add_argument('--noise', type=float, default=GPS_NOISE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--single', action='store_true', help='all fields in one fields.shp')
+    args = parser.parse_args()
+
+    fields = generate_fields(args.kinds.split(','), args.count, args.seed, area=args.area,
+                             vertices=args.vertices, holes=args.holes, noise=args.noise)
+    if args.single:
+        os.makedirs(args.directory, exist_ok=True)
+        write_shapefile(os.path.join(args.directory, 'fields.shp'), fields)
+    else:
+        for name, filename in write_field_files(args.directory, fields).items():
+            print(name, filename)
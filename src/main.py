@@ -9,6 +9,8 @@ import shapefile
 from core import Model
 from map import Map
 from functools import partial
+from collections import OrderedDict
+from export import FORMATS
 import os
 
 stylesheetPath = os.path.join(os.path.dirname(__file__), "darkStyle.qss")
@@ -44,8 +46,10 @@ class Form(QWidget):
         self.openButton.clicked.connect(self.openFileButtonCallback)
         self.calcButton = QPushButton(text="Calculate")
         self.calcButton.setEnabled(False)
+        self.cancelButton = QPushButton(text="Cancel")
+        self.cancelButton.setEnabled(False)
         self.exportButton = QPushButton(text="Export...")
-        self.exportButton.clicked.connect(self.model.exportF)
+        self.exportButton.clicked.connect(self.exportButtonCallback)
 
         # Parameters group
         self.paramsGroup = QGroupBox("Calc parameters")
@@ -104,6 +108,9 @@ class Form(QWidget):
             textEdit.textChanged.connect(self.checkIfAllRight)
 
         self.calcButton.clicked.connect(self.calculateGeometry)
+        self.cancelButton.clicked.connect(self.model.cancelCalculation)
+        self.model.startLongOperation.connect(self.onCalculationStarted)
+        self.model.longOperationFinished.connect(self.onCalculationFinished)
 
         # COMPOSING
 
@@ -116,6 +123,7 @@ class Form(QWidget):
         fileGroupLayout.addWidget(self.fileName)
         fileGroupLayout.addWidget(self.openButton)
         fileGroupLayout.addWidget(self.calcButton)
+        fileGroupLayout.addWidget(self.cancelButton)
         fileGroupLayout.addWidget(self.exportButton)
 
         mapBoxLayout.addWidget(self.map)
@@ -159,18 +167,49 @@ class Form(QWidget):
         self.model.pullGeometryFromFile(fileNames[0])
         self.fileName.setText(fileNames[0])
 
+    def exportButtonCallback(self):
+        # фильтр диалога -> форматы экспорта (см. export.FORMATS)
+        filters = OrderedDict([
+            ("All formats (*.shp *.geojson *.tsp)", FORMATS),
+            ("Shapefile (*.shp)", ('shp',)),
+            ("GeoJSON (*.geojson)", ('geojson',)),
+            ("Terminal track (*.tsp)", ('bin',)),
+        ])
+        fileName, selectedFilter = QFileDialog.getSaveFileName(
+            self, "Export paths", "paths", ";;".join(filters))
+        if fileName:
+            self.model.exportF(fileName, filters.get(selectedFilter, FORMATS))
+
     def checkIfAllRight(self):
         check = True
         for textEdit in self.dataFields:
             if textEdit.text() == "":
                 check = False
-        self.calcButton.setEnabled(check)
+        self.calcButton.setEnabled(check and not self.model.isCalculating())
 
     def calculateGeometry(self):
+        try:
+            rowWidth = float(self.rowWidthEdit.text())
+            self.model.tractorWidth = float(self.tractorWidthEdit.text())
+            self.model.tractorWheelBase = float(self.tractorWheelBaseEdit.text())
+            self.model.rowWidth = rowWidth
+            self.model.seederWidth = float(self.seederWidthEdit.text()) * rowWidth
+            self.model.sprinklerWidth = float(self.sprinklerWidthEdit.text()) * rowWidth
+            self.model.turnRadius = float(self.turnRadiusEdit.text())
+        except ValueError as e:
+            print("Wrong parameters: {}".format(e))
+            return
         self.model.calculate()
-        print("SHOW MUST GO ON!")
-        self.model.turnRadius = float(self.turnRadiusEdit.text())
-        self.model.calculate()
+
+    def onCalculationStarted(self):
+        self.calcButton.setEnabled(False)
+        self.calcButton.setText("Calculating...")
+        self.cancelButton.setEnabled(True)
+
+    def onCalculationFinished(self):
+        self.calcButton.setText("Calculate")
+        self.cancelButton.setEnabled(False)
+        self.checkIfAllRight()
 
 if __name__ == "__main__":
     app = QtWidgets.QApplication([])
@@ -0,0 +1,124 @@
+import typing as t
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from shapely import geometry
+
+
+# Максимальный объем кэша смещенных колец, байт
+OFFSET_CACHE_BYTES = 64 * 1024 * 1024
+
+# Примерный объем одной точки кольца в кэше (кортеж из двух float), байт
+POINT_BYTES = 120
+
+# Тип углов при смещении (shapely JOIN_STYLE): 1 - round, 2 - mitre, 3 - bevel
+JOIN_ROUND = 1
+
+
+def ring_key(coords: t.List[t.Tuple[float, float]]) -> bytes:
+    """Хэш координат кольца."""
+    points = np.asarray(coords, dtype='float64')
+    points = np.ascontiguousarray(points[:, :2] if len(points) else points)
+    return hashlib.blake2b(points.tobytes(), digest_size=16).digest()
+
+
+class OffsetRings:
+    """
+    Смещение колец внутрь/наружу (shapely buffer) с кэшем результатов.
+
+    Ключ кэша - хэш координат, расстояние, тип углов и направление,
+    поэтому повторные смещения одной границы (в том числе пришедшей
+    новым списком) не пересчитываются. Кэш вытесняет давно не
+    использованные кольца при превышении max_bytes.
+    Кэш общий для потоков расчета, обращения к нему защищены блокировкой.
+    """
+
+    def __init__(self, max_bytes: int = OFFSET_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__rings = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def offset(self,
+               coords: t.List[t.Tuple[float, float]],
+               distance: float,
+               join_style: int = JOIN_ROUND,
+               swell: bool = False) -> t.List[t.Tuple[float, float]]:
+        """
+        Сжимает или расширяет полигон на заданный отступ.
+
+        Args:
+            coords: Координаты полигона
+            distance: Растояние отступа от границы исходного полигона
+            join_style: Тип углов (см. JOIN_ROUND)
+            swell: Флаг растягивания/сжатия
+
+        Returns:
+            Координаты полученного полигона (новый список), [] если полигон исчез
+        """
+        key = (ring_key(coords), float(distance), join_style, bool(swell))
+        with self.__lock:
+            ring = self.__rings.get(key)
+            if ring is not None:
+                self.__rings.move_to_end(key)
+                self.hits += 1
+                return list(ring)
+            self.misses += 1
+
+        polygon = geometry.Polygon(coords)
+        if swell:
+            polygon_resized = polygon.buffer(distance, join_style=join_style)  # Растянуть
+        else:
+            polygon_resized = polygon.buffer(-distance, join_style=join_style)  # Сжать
+
+        if polygon_resized.is_empty:
+            ring = ()
+        else:
+            ring = tuple(geometry.mapping(polygon_resized)['coordinates'][0])
+        self.__store(key, ring)
+        return list(ring)
+
+    def successive(self,
+                   coords: t.List[t.Tuple[float, float]],
+                   distance: float,
+                   count: int,
+                   join_style: int = JOIN_ROUND) -> t.List[t.List[t.Tuple[float, float]]]:
+        """
+        count колец, каждое из которых сжато на distance относительно предыдущего.
+        Каждый шаг кэшируется, поэтому повторный расчет (в том числе с большим
+        count) пересчитывает только новые кольца.
+        """
+        rings = []
+        ring = coords
+        for _ in range(count):
+            ring = self.offset(ring, distance, join_style)
+            rings.append(ring)
+        return rings
+
+    def clear(self):
+        with self.__lock:
+            self.__rings.clear()
+            self.size = 0
+
+    def __store(self, key, ring):
+        with self.__lock:
+            # кольцо могло быть посчитано одновременно в другом потоке
+            old = self.__rings.pop(key, None)
+            if old is not None:
+                self.size -= len(old) * POINT_BYTES
+            self.__rings[key] = ring
+            self.size += len(ring) * POINT_BYTES
+            self.__evict()
+
+    def __evict(self):
+        while self.size > self.max_bytes and len(self.__rings) > 1:
+            _, old = self.__rings.popitem(last=False)
+            self.size -= len(old) * POINT_BYTES
+
+
+# Общий кэш смещенных колец
+offset_rings = OffsetRings()
@@ -0,0 +1,167 @@
+import typing as t
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import spatial
+
+
+# Сколько подготовленных колец хранится в кэше prepared_ring
+PREPARED_CACHE_SIZE = 16
+
+
+class PerimeterIndex:
+    """
+    Индекс замкнутого пути (кольца) для быстрых запросов по периметру:
+    накопленная длина дуги от первой вершины и KD-дерево вершин.
+    Последняя вершина соединяется с первой замыкающим отрезком.
+    """
+
+    def __init__(self, ring: t.List[t.Tuple[float, float]]):
+        """
+        Args:
+            ring: Координаты вершин пути
+        """
+        self.ring = list(ring)
+        self.points = np.asarray(ring, dtype='float64')[:, :2]
+        steps = np.hypot(*np.diff(self.points, axis=0).T)
+        # arc[i] - длина пути от вершины 0 до вершины i
+        self.arc = np.concatenate([[0.0], np.cumsum(steps)])
+        self.length = self.arc[-1] + np.hypot(*(self.points[0] - self.points[-1]))
+        self.tree = spatial.KDTree(self.points)
+        # Отрезки (включая замыкающий) и их максимальная длина
+        self.starts = self.points
+        self.ends = np.roll(self.points, -1, axis=0)
+        self.max_segment = np.hypot(*(self.ends - self.starts).T).max()
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest_vertex(self, point: t.Tuple[float, float]) -> int:
+        """Индекс ближайшей к точке вершины."""
+        return int(self.tree.query(np.asarray(point, dtype='float64')[:2])[1])
+
+    def forward_distance(self, i: int, j: int) -> float:
+        """Длина пути по периметру от вершины i до вершины j в порядке вершин."""
+        if j >= i:
+            return self.arc[j] - self.arc[i]
+        return self.length - self.arc[i] + self.arc[j]
+
+    def project(self, point: t.Tuple[float, float]) -> t.Tuple[t.Tuple[float, float], float]:
+        """
+        Ближайшая к точке точка периметра.
+
+        Проверяются только отрезки, у которых есть вершина не дальше
+        (расстояние до ближайшей вершины + половина самого длинного отрезка):
+        у более далеких отрезков все точки дальше ближайшей вершины.
+
+        Returns:
+            (ближайшая точка, ее положение на периметре - длина дуги от вершины 0)
+        """
+        point = np.asarray(point, dtype='float64')[:2]
+        distance, _ = self.tree.query(point)
+        near = self.tree.query_ball_point(point, distance + self.max_segment / 2.0)
+        candidates = np.unique(np.concatenate([near, np.subtract(near, 1) % len(self)]))
+
+        a, b = self.starts[candidates], self.ends[candidates]
+        ab = b - a
+        norm = np.einsum('ij,ij->i', ab, ab)
+        s = np.clip(np.einsum('ij,ij->i', point - a, ab) / np.where(norm > 0, norm, 1.0), 0.0, 1.0)
+        projections = a + s[:, None] * ab
+        best = np.argmin(np.hypot(*(projections - point).T))
+
+        segment = candidates[best]
+        position = self.arc[segment] + s[best] * np.sqrt(norm[best])
+        return tuple(projections[best]), position % self.length if self.length else 0.0
+
+    def contains(self, point: t.Tuple[float, float]) -> bool:
+        """Лежит ли точка внутри кольца (правило четности пересечений)."""
+        x, y = np.asarray(point, dtype='float64')[:2]
+        a, b = self.starts, self.ends
+        crosses = (a[:, 1] > y) != (b[:, 1] > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = a[:, 0] + (y - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+        return bool(np.count_nonzero(crosses & (x < x_cross)) % 2)
+
+    def nearest_point(self, point: t.Tuple[float, float]) -> t.Tuple[float, float]:
+        """
+        Ближайшая точка полигона, ограниченного кольцом: сама точка,
+        если она внутри, иначе ее проекция на периметр.
+        """
+        if self.contains(point):
+            return tuple(float(c) for c in point[:2])
+        return self.project(point)[0]
+
+    def shortest_arc(self, p1: t.Tuple[float, float], p2: t.Tuple[float, float]) -> t.Tuple[float, int]:
+        """
+        Кратчайшее расстояние по периметру между проекциями двух точек.
+
+        Returns:
+            (расстояние, направление: 1 - в порядке вершин, -1 - в обратном)
+        """
+        _, s1 = self.project(p1)
+        _, s2 = self.project(p2)
+        forward = (s2 - s1) % self.length
+        if forward <= self.length - forward:
+            return forward, 1
+        return self.length - forward, -1
+
+    def path_between(self, p1: t.Tuple[float, float],
+                     p2: t.Tuple[float, float]) -> t.Tuple[t.List[t.Tuple[float, float]], float]:
+        """
+        Путь по вершинам периметра в порядке вершин от ближайшей к p1
+        вершины до ближайшей к p2 (см. border_path.polygon_perimeter_between_points).
+
+        Returns:
+            (вершины пути, его длина)
+        """
+        i, j = self.nearest_vertex(p1), self.nearest_vertex(p2)
+        if i == j:
+            return [], 0.0
+        if j > i:
+            path = self.ring[i: j + 1]
+        else:
+            path = self.ring[i:] + self.ring[: j + 1]
+        return list(path), self.forward_distance(i, j)
+
+    def distance_between(self, p1: t.Tuple[float, float], p2: t.Tuple[float, float]) -> float:
+        """Длина пути path_between без построения списка вершин."""
+        return self.forward_distance(self.nearest_vertex(p1), self.nearest_vertex(p2))
+
+
+_prepared_cache = OrderedDict()
+# Кэш используется потоком интерфейса и потоками расчета
+_prepared_lock = threading.Lock()
+
+
+def prepared_ring(ring: t.List[t.Tuple[float, float]]) -> PerimeterIndex:
+    """
+    PerimeterIndex кольца из кэша.
+
+    Ключ кэша - сам объект списка координат (кэш держит на него ссылку),
+    поэтому после изменения списка на месте вызовите invalidate(ring).
+    Изменение количества точек обнаруживается автоматически.
+    """
+    key = id(ring)
+    with _prepared_lock:
+        entry = _prepared_cache.get(key)
+        if entry is not None and entry[0] is ring and entry[1] == len(ring):
+            _prepared_cache.move_to_end(key)
+            return entry[2]
+
+    index = PerimeterIndex(ring)
+    with _prepared_lock:
+        _prepared_cache[key] = (ring, len(ring), index)
+        _prepared_cache.move_to_end(key)
+        while len(_prepared_cache) > PREPARED_CACHE_SIZE:
+            _prepared_cache.popitem(last=False)
+    return index
+
+
+def invalidate(ring: t.List[t.Tuple[float, float]] = None):
+    """Удаляет кольцо (или все кольца, если ring не задано) из кэша prepared_ring."""
+    with _prepared_lock:
+        if ring is None:
+            _prepared_cache.clear()
+        else:
+            _prepared_cache.pop(id(ring), None)
@@ -0,0 +1,138 @@
+"""
+Кэш готовых маршрутов на диске.
+
+Ключ - хэш границы поля, препятствий, отступа, ширин агрегатов, точек входа
+и выхода, параметров планирования и версии алгоритма. Маршрут хранится в файле
+<ключ>.npy (массив float64 nx2), поэтому попадание в кэш - это чтение
+одного файла.
+"""
+import os
+import json
+import hashlib
+import typing as t
+
+import numpy as np
+
+
+# Версия алгоритма планирования; увеличить при любом изменении,
+# меняющем построенные маршруты, чтобы старые записи не использовались
+ALGORITHM_VERSION = 4
+
+# Каталог кэша по умолчанию (можно переопределить переменной окружения)
+PLAN_CACHE_DIR = os.environ.get(
+    'THESMARTPATH_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'thesmartpath', 'plans'))
+
+# Максимальный объем кэша на диске, байт
+PLAN_CACHE_BYTES = 256 * 1024 * 1024
+
+# Параметры build_path2, не влияющие на построенный маршрут
+RUNTIME_PARAMS = ('cancel', 'progress', 'sweep_workers')
+
+
+def plan_key(border: t.List[t.Tuple[float, float]],
+             entry_point: t.Tuple[float, float],
+             exit_point: t.Tuple[float, float],
+             border_step: float,
+             params: dict = None,
+             widths: dict = None,
+             holes: t.List[t.List[t.Tuple[float, float]]] = ()) -> str:
+    """
+    Ключ маршрута в кэше.
+
+    Args:
+        border: Координаты границ поля
+        entry_point, exit_point: Точки входа и выхода
+        border_step: Отступ от границы поля
+        params: Параметры build_path2 (RUNTIME_PARAMS не учитываются)
+        widths: Ширины агрегатов и другие параметры техники, {имя: значение}
+        holes: Координаты препятствий внутри поля
+
+    Returns:
+        Шестнадцатеричная строка
+    """
+    params = {k: v for k, v in (params or {}).items() if k not in RUNTIME_PARAMS}
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(ALGORITHM_VERSION).encode())
+    for points in [border, [entry_point, exit_point]] + list(holes):
+        points = np.asarray(points, dtype='float64')
+        h.update(np.ascontiguousarray(points[:, :2] if len(points) else points).tobytes())
+    h.update(json.dumps([float(border_step), params, widths or {}],
+                        sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class PlanCache:
+    """
+    Маршруты в файлах каталога directory.
+
+    При превышении max_bytes удаляются давно не использованные файлы
+    (время использования - время изменения файла, обновляется при чтении).
+    """
+
+    def __init__(self, directory: str = PLAN_CACHE_DIR, max_bytes: int = PLAN_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> t.Optional[t.List[t.List[float]]]:
+        """
+        Returns:
+            Маршрут или None, если его нет в кэше
+        """
+        filename = self.__filename(key)
+        try:
+            path = np.load(filename, allow_pickle=False)
+            os.utime(filename)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path.tolist()
+
+    def put(self, key: str, path: t.List[t.Tuple[float, float]]):
+        """Сохраняет маршрут; ошибки записи не прерывают планирование."""
+        path = np.asarray(path, dtype='float64').reshape((-1, 2))
+        filename = self.__filename(key)
+        temp = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, 'wb') as f:
+                np.save(f, path, allow_pickle=False)
+            os.replace(temp, filename)
+            self.evict()
+        except OSError as e:
+            print("Plan cache write error: {}".format(e))
+
+    def evict(self):
+        """
+        Удаляет давно не использованные маршруты сверх max_bytes.
+        Файлы, удаленные одновременно другим потоком или процессом, пропускаются.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(e[1] for e in entries)
+        for _, file_size, filename in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            size -= file_size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.npy'):
+                    os.remove(entry.path)
+
+    def __filename(self, key):
+        return os.path.join(self.directory, key + '.npy')
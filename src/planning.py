@@ -0,0 +1,125 @@
+"""
+Планирование маршрутов сева и полива для одного поля без GUI.
+"""
+import threading
+import time
+import typing as t
+
+import constants as const
+from border_path import build_path2, SMOOTH_WINDOW
+
+
+# Работы, планируемые для поля
+TASKS = ('seeding', 'sprinkling')
+
+
+def border_steps(seeder_width: float = const.Geometry.SEEDER_WIDTH,
+                 row_width: float = const.Geometry.SEEDER_ROW_WIDTH) -> t.Dict[str, float]:
+    """
+    Отступы от границы поля для сева и полива, метры.
+    """
+    seeder_border_step = seeder_width / 2 + 0.05  # пол ширины сеялки + 5 см запас
+    sprinkler_border_step = seeder_border_step + 5 * row_width  # +5 рядов к отступу сеялки
+    return {'seeding': seeder_border_step, 'sprinkling': sprinkler_border_step}
+
+
+def plan_field(border: t.List[t.Tuple[float, float]],
+               entry_point: t.Tuple[float, float],
+               exit_point: t.Tuple[float, float],
+               params: dict = None,
+               tasks: t.Iterable[str] = TASKS,
+               steps: t.Dict[str, float] = None,
+               holes: t.List[t.List[t.Tuple[float, float]]] = ()) -> t.Dict[str, dict]:
+    """
+    Строит маршруты для поля.
+
+    Args:
+        border: Координаты границ поля, метры
+        entry_point, exit_point: Точки входа и выхода
+        params: Параметры планирования build_path2
+        tasks: Работы из TASKS
+        steps: Отступы от границы для работ (по умолчанию border_steps())
+        holes: Координаты препятствий внутри поля, метры (см. build_path2)
+
+    Returns:
+        {работа: {'path': маршрут, 'time': время расчета, с}}
+    """
+    params = {} if params is None else params
+    steps = border_steps() if steps is None else steps
+
+    result = {}
+    for task in tasks:
+        started = time.perf_counter()
+        path = build_path2(
+            border=border,
+            entry_point=entry_point,
+            exit_point=exit_point,
+            border_step=steps[task],
+            params=params,
+            debug_data={},
+            holes=holes,
+        )
+        result[task] = {'path': path, 'time': time.perf_counter() - started}
+    return result
+
+
+class PlanningSession:
+    """
+    Сеанс планирования одной работы на одном поле.
+
+    Хранит этапы build_path2, не зависящие от точек входа и выхода
+    (круги вдоль границ, маршруты покрытия по углам, сглаживание окон),
+    поэтому при перемещении точек пересчитываются только переезды,
+    их сглаживание и выбор угла.
+
+    Маршрут покрытия сглаживается окнами (параметр 'smooth_window',
+    по умолчанию SMOOTH_WINDOW), иначе сглаживание всего маршрута
+    пришлось бы повторять целиком.
+
+    Расчеты одного сеанса выполняются по очереди (self.lock): новый расчет
+    ждет, пока отмененный предыдущий не освободит кэш.
+    """
+
+    def __init__(self,
+                 border: t.List[t.Tuple[float, float]],
+                 border_step: float,
+                 params: dict = None,
+                 holes: t.List[t.List[t.Tuple[float, float]]] = ()):
+        """
+        Args:
+            border: Координаты границ поля, метры
+            border_step: Отступ от границы поля, метры
+            params: Параметры планирования build_path2
+            holes: Координаты препятствий внутри поля, метры
+        """
+        self.border = [tuple(p) for p in border]
+        self.holes = [[tuple(p) for p in hole] for hole in holes]
+        self.border_step = border_step
+        self.params = dict(params or {})
+        self.params.setdefault('smooth_window', SMOOTH_WINDOW)
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def plan(self,
+             entry_point: t.Tuple[float, float],
+             exit_point: t.Tuple[float, float],
+             params: dict = None,
+             debug_data: dict = None) -> list:
+        """
+        Строит маршрут для точек входа и выхода.
+
+        Args:
+            params: Дополнительные параметры этого расчета
+                    (например, 'cancel' и 'progress')
+        """
+        with self.lock:
+            return build_path2(
+                border=self.border,
+                entry_point=entry_point,
+                exit_point=exit_point,
+                border_step=self.border_step,
+                params=dict(self.params, **(params or {})),
+                debug_data={} if debug_data is None else debug_data,
+                cache=self.cache,
+                holes=self.holes,
+            )
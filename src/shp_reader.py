@@ -0,0 +1,186 @@
+"""
+Чтение точек .shp без создания объектов Python на каждую точку.
+
+Файл .shp отображается в память (mmap), смещения записей берутся из индекса
+.shx, а точки каждой записи возвращаются как numpy-представление
+(float64, x и y подряд) прямо над отображенным файлом, без копирования.
+"""
+import os
+import mmap
+import struct
+import typing as t
+
+import numpy as np
+
+
+# Размер заголовка .shp и .shx, байт
+HEADER_BYTES = 100
+
+# Типы фигур shapefile
+NULL = 0
+POINT_TYPES = (1, 11, 21)
+MULTIPOINT_TYPES = (8, 18, 28)
+PART_TYPES = (3, 5, 13, 15, 23, 25)  # линии и полигоны
+POLYGON_TYPES = (5, 15, 25)
+Z_TYPES = (11, 13, 15, 18)
+
+_EMPTY_POINTS = np.empty((0, 2))
+
+
+class ShapeFileMap:
+    """
+    Отображенный в память .shp.
+
+    Массивы points/parts/z - представления над файлом: они действительны,
+    пока существуют, даже после close() (отображение освобождается,
+    когда исчезает последнее представление). Не изменяйте их - файл
+    открыт только для чтения.
+    """
+
+    def __init__(self, shp_file: str):
+        """
+        Args:
+            shp_file: Путь к .shp; .shx ищется рядом (без него смещения
+                      записей находятся последовательным проходом по .shp)
+        """
+        base = os.path.splitext(shp_file)[0]
+        with open(base + '.shp', 'rb') as f:
+            self.__shp = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.shape_type = struct.unpack_from('<i', self.__shp, 32)[0]
+
+        shx = base + '.shx'
+        if os.path.exists(shx):
+            index = np.fromfile(shx, dtype='>i4', offset=HEADER_BYTES).reshape((-1, 2))
+            # смещения в 16-битных словах, на заголовок записи 8 байт
+            self.offsets = index[:, 0].astype(np.int64) * 2 + 8
+            self.lengths = index[:, 1].astype(np.int64) * 2
+        else:
+            self.offsets, self.lengths = self.__scan()
+
+    def __scan(self):
+        offsets, lengths = [], []
+        position, size = HEADER_BYTES, len(self.__shp)
+        while position + 8 <= size:
+            length = struct.unpack_from('>i', self.__shp, position + 4)[0] * 2
+            offsets.append(position + 8)
+            lengths.append(length)
+            position += 8 + length
+        return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        try:
+            self.__shp.close()
+        except BufferError:
+            # остались представления - отображение закроется вместе с ними
+            pass
+
+    def record_type(self, i: int) -> int:
+        return struct.unpack_from('<i', self.__shp, int(self.offsets[i]))[0]
+
+    def __layout(self, i):
+        """(тип, количество частей, количество точек, смещение частей, смещение точек)"""
+        offset = int(self.offsets[i])
+        shape_type = struct.unpack_from('<i', self.__shp, offset)[0]
+        if shape_type in PART_TYPES:
+            num_parts, num_points = struct.unpack_from('<2i', self.__shp, offset + 36)
+            return shape_type, num_parts, num_points, offset + 44, offset + 44 + 4 * num_parts
+        if shape_type in MULTIPOINT_TYPES:
+            num_points = struct.unpack_from('<i', self.__shp, offset + 36)[0]
+            return shape_type, 0, num_points, offset + 40, offset + 40
+        if shape_type in POINT_TYPES:
+            return shape_type, 0, 1, offset + 4, offset + 4
+        return shape_type, 0, 0, offset, offset
+
+    def points(self, i: int) -> np.ndarray:
+        """Точки записи i, представление n x 2 (x, y)."""
+        _, _, num_points, _, points = self.__layout(i)
+        if not num_points:
+            return _EMPTY_POINTS
+        return np.frombuffer(self.__shp, dtype='<f8', count=2 * num_points, offset=points).reshape((-1, 2))
+
+    def parts(self, i: int) -> np.ndarray:
+        """Индексы первых точек частей записи i (int32)."""
+        _, num_parts, num_points, parts, _ = self.__layout(i)
+        if not num_parts:
+            return np.zeros(1 if num_points else 0, dtype='<i4')
+        return np.frombuffer(self.__shp, dtype='<i4', count=num_parts, offset=parts)
+
+    def rings(self, i: int) -> t.List[np.ndarray]:
+        """Части (кольца полигона или линии) записи i - представления n x 2."""
+        points = self.points(i)
+        return np.split(points, self.parts(i)[1:]) if len(points) else []
+
+    def z(self, i: int) -> t.Optional[np.ndarray]:
+        """Координаты Z записи i (для типов с Z), представление."""
+        shape_type, _, num_points, _, points = self.__layout(i)
+        if shape_type not in Z_TYPES or not num_points:
+            return None
+        if shape_type in POINT_TYPES:
+            return np.frombuffer(self.__shp, dtype='<f8', count=1, offset=points + 16)
+        # после точек - диапазон Z (2 числа) и сами Z
+        return np.frombuffer(self.__shp, dtype='<f8', count=num_points, offset=points + 16 * num_points + 16)
+
+    def bbox(self, i: int) -> t.Optional[np.ndarray]:
+        """(xmin, ymin, xmax, ymax) записи i или None для точки и пустой записи."""
+        shape_type = self.record_type(i)
+        if shape_type in PART_TYPES or shape_type in MULTIPOINT_TYPES:
+            return np.frombuffer(self.__shp, dtype='<f8', count=4, offset=int(self.offsets[i]) + 4)
+        return None
+
+    def iter_rings(self) -> t.Iterator[t.Tuple[int, t.List[np.ndarray]]]:
+        """(номер записи, кольца) для всех записей."""
+        for i in range(len(self)):
+            yield i, self.rings(i)
+
+
+def signed_area(ring: np.ndarray) -> float:
+    """Ориентированная площадь кольца (< 0 - по часовой стрелке)."""
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def __inside(point, ring):
+    """Точка внутри кольца (правило четности пересечений)."""
+    x, y = ring[:, 0], ring[:, 1]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    crosses = (y > point[1]) != (y1 > point[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xs = x + (point[1] - y) * (x1 - x) / (y1 - y)
+    return bool(np.count_nonzero(crosses & (point[0] < xs)) % 2)
+
+
+def organize_rings(rings: t.List[np.ndarray]) -> t.List[t.List[np.ndarray]]:
+    """
+    Разбирает кольца записи-полигона на полигоны: внешние кольца в shapefile
+    идут по часовой стрелке, отверстия - против. Отверстие относится
+    к первому внешнему кольцу, в котором лежит его первая точка.
+    Если внешних колец нет (неверная ориентация), каждое кольцо - полигон.
+
+    Returns:
+        [[внешнее кольцо, отверстия...]]
+    """
+    rings = [r for r in rings if len(r) >= 3]
+    clockwise = [signed_area(r) < 0 for r in rings]
+    if not any(clockwise):
+        return [[r] for r in rings]
+
+    polygons = [[r] for r, cw in zip(rings, clockwise) if cw]
+    for ring, cw in zip(rings, clockwise):
+        if cw:
+            continue
+        for polygon in polygons:
+            if __inside(ring[0], polygon[0]):
+                polygon.append(ring)
+                break
+        else:
+            polygons.append([ring])
+    return polygons
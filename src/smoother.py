@@ -1,14 +1,77 @@
+import time
+
 import numpy as np
-from scipy import optimize
+from scipy import optimize, sparse
+from scipy.linalg import solveh_banded
+from scipy.sparse.linalg import spsolve
+
+
+# Веса слагаемых функции стоимости
+ENDPOINT_WEIGHT = 100.0   # привязка первой и последней точек
+DEVIATION_WEIGHT = 5.0    # отклонение от исходной траектории
+MIDPOINT_WEIGHT = 15.0    # отклонение от середины соседних точек
+HEADING_WEIGHT = 0.0001   # изменение курса
+CURVATURE_WEIGHT = 0.0001 # кривизна больше допустимой
+
+
+def _gradient_matrix(n):
+    u"""
+    Sparse matrix of np.gradient (unit spacing, edge_order=1).
+
+    Args:
+        n (int): количество точек (n >= 2).
+
+    Return:
+        scipy.sparse.csr_matrix: матрица nxn.
+    """
+    rows = [0, 0, n - 1, n - 1]
+    cols = [0, 1, n - 2, n - 1]
+    vals = [-1.0, 1.0, -1.0, 1.0]
+    inner = np.arange(1, n - 1)
+    rows = np.concatenate([rows, inner, inner])
+    cols = np.concatenate([cols, inner - 1, inner + 1])
+    vals = np.concatenate([vals, np.full(inner.size, -0.5), np.full(inner.size, 0.5)])
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(n, n))
+
+
+def _gradient_adjoint(g):
+    u"""
+    Transposed operator of np.gradient (unit spacing, edge_order=1).
+
+    Args:
+        g (np.ndarray): вектор длины n (n >= 2).
+
+    Return:
+        np.ndarray: D^T g, где D - матрица np.gradient.
+    """
+    res = np.zeros_like(g)
+    res[0] -= g[0]
+    res[1] += g[0]
+    res[2:] += 0.5 * g[1:-1]
+    res[:-2] -= 0.5 * g[1:-1]
+    res[-1] += g[-1]
+    res[-2] -= g[-1]
+    return res
+
 
 class PathSmoother(object):
-    def __init__(self, max_curv, tol=1e-8, method='CG'):
+    def __init__(self, max_curv, tol=1e-8, method='CG', passes=3):
+        u"""
+        Args:
+            max_curv (float): максимальная кривизна без штрафа.
+            tol (float): точность оптимизации.
+            method (str): метод scipy.optimize.minimize
+                или 'banded' - прямое решение ленточной системы
+                с уточнением проходами Гаусса-Ньютона.
+            passes (int): количество проходов Гаусса-Ньютона для 'banded'.
+        """
         self.MAX_CURV = max_curv
 
         self.TOL = tol
         self.OPT_METHOD = method
+        self.PASSES = passes
+
 
- 
     def calc_curvatire(self, x):
         dx_dt = np.gradient(x[:, 0])
         dy_dt = np.gradient(x[:, 1])
@@ -20,11 +83,117 @@ class PathSmoother(object):
         d2x_dt2 = np.gradient(dx_dt)
         d2y_dt2 = np.gradient(dy_dt)
 
-        curvature = np.abs(d2x_dt2 * dy_dt - dx_dt * d2y_dt2) / (dx_dt * dx_dt + dy_dt * dy_dt)**1.5
+        with np.errstate(divide='ignore', invalid='ignore'):
+            curvature = np.abs(d2x_dt2 * dy_dt - dx_dt * d2y_dt2) / (dx_dt * dx_dt + dy_dt * dy_dt)**1.5
         return curvature, dx_dt, dy_dt, d2x_dt2, d2y_dt2
 
+    def _curvature_mask(self, curvature):
+        u"""Interior points where curvature exceeds MAX_CURV (NaN never does)."""
+        mask = np.zeros(curvature.size, dtype=bool)
+        with np.errstate(invalid='ignore'):
+            mask[1:-1] = curvature[1:-1] > self.MAX_CURV
+        return mask
+
     def objective(self, x, x0):
+        u"""
+        Smoothing cost, vectorized over all points.
+
+        Args:
+            x (np.ndarray): траектория, вектор [x0, y0, x1, y1, ...].
+            x0 (np.ndarray): исходная траектория в том же формате.
+
+        Return:
+            float.
+        """
+        p = x.reshape(-1, 2)
+        p0 = x0.reshape(-1, 2)
+        curvature = self.calc_curvatire(p)[0]
+
+        cost = ENDPOINT_WEIGHT * np.sum((p[0] - p0[0]) ** 2)
+        cost += ENDPOINT_WEIGHT * np.sum((p[-1] - p0[-1]) ** 2)
 
+        v = np.diff(p, axis=0)
+        heading = np.arctan2(v[:, 1], v[:, 0])
+        theta = np.diff(heading)
+        theta = np.arctan2(np.sin(theta), np.cos(theta))
+        cost += HEADING_WEIGHT * np.sum(theta ** 2)
+
+        d = p[1:-1] - (p[:-2] + p[2:]) / 2.0
+        cost += DEVIATION_WEIGHT * np.sum((p0[1:-1] - p[1:-1]) ** 2)
+        cost += MIDPOINT_WEIGHT * np.sum(d ** 2)
+
+        mask = self._curvature_mask(curvature)
+        cost += CURVATURE_WEIGHT * np.sum(curvature[mask] ** 2)
+
+        return cost
+
+    def gradient(self, x, x0):
+        u"""
+        Analytic gradient of objective.
+
+        Args:
+            x (np.ndarray): траектория, вектор [x0, y0, x1, y1, ...].
+            x0 (np.ndarray): исходная траектория в том же формате.
+
+        Return:
+            np.ndarray: вектор той же длины, что и x.
+        """
+        p = x.reshape(-1, 2)
+        p0 = x0.reshape(-1, 2)
+        grad = np.zeros_like(p, dtype='float64')
+
+        grad[0] += 2.0 * ENDPOINT_WEIGHT * (p[0] - p0[0])
+        grad[-1] += 2.0 * ENDPOINT_WEIGHT * (p[-1] - p0[-1])
+
+        # Изменение курса: theta_i = a_i - a_(i-1), a_j - курс отрезка j
+        v = np.diff(p, axis=0)
+        heading = np.arctan2(v[:, 1], v[:, 0])
+        theta = np.diff(heading)
+        theta = np.arctan2(np.sin(theta), np.cos(theta))
+        g_theta = 2.0 * HEADING_WEIGHT * theta
+        g_heading = np.zeros_like(heading)
+        g_heading[1:] += g_theta
+        g_heading[:-1] -= g_theta
+        r2 = v[:, 0] ** 2 + v[:, 1] ** 2
+        nonzero = r2 > 0.0
+        g_v = np.zeros_like(v)
+        g_v[nonzero, 0] = -g_heading[nonzero] * v[nonzero, 1] / r2[nonzero]
+        g_v[nonzero, 1] = g_heading[nonzero] * v[nonzero, 0] / r2[nonzero]
+        grad[1:] += g_v
+        grad[:-1] -= g_v
+
+        # Отклонение от исходной траектории и от середины соседних точек
+        grad[1:-1] += 2.0 * DEVIATION_WEIGHT * (p[1:-1] - p0[1:-1])
+        d = p[1:-1] - (p[:-2] + p[2:]) / 2.0
+        grad[1:-1] += 2.0 * MIDPOINT_WEIGHT * d
+        grad[:-2] -= MIDPOINT_WEIGHT * d
+        grad[2:] -= MIDPOINT_WEIGHT * d
+
+        # Кривизна: k^2 = c^2 / s^3, c = x''y' - x'y'', s = x'^2 + y'^2
+        curvature, dx, dy, d2x, d2y = self.calc_curvatire(p)
+        mask = self._curvature_mask(curvature)
+        if mask.any():
+            c = d2x[mask] * dy[mask] - dx[mask] * d2y[mask]
+            s = dx[mask] ** 2 + dy[mask] ** 2
+            g_c = CURVATURE_WEIGHT * 2.0 * c / s ** 3
+            g_s = -CURVATURE_WEIGHT * 3.0 * c ** 2 / s ** 4
+
+            g_dx = np.zeros_like(dx)
+            g_dy = np.zeros_like(dy)
+            g_d2x = np.zeros_like(d2x)
+            g_d2y = np.zeros_like(d2y)
+            g_dx[mask] = -g_c * d2y[mask] + 2.0 * g_s * dx[mask]
+            g_dy[mask] = g_c * d2x[mask] + 2.0 * g_s * dy[mask]
+            g_d2x[mask] = g_c * dy[mask]
+            g_d2y[mask] = -g_c * dx[mask]
+
+            grad[:, 0] += _gradient_adjoint(g_dx + _gradient_adjoint(g_d2x))
+            grad[:, 1] += _gradient_adjoint(g_dy + _gradient_adjoint(g_d2y))
+
+        return grad.reshape(-1)
+
+    def _objective_loop(self, x, x0):
+        u"""Scalar per-point implementation of objective, kept as a reference."""
         cost = 0
         curvature, dx_dt, dy_dt, d2x_dt2, d2y_dt2 = self.calc_curvatire(x.reshape(-1, 2))
 
@@ -36,8 +205,8 @@ class PathSmoother(object):
         x_last = np.array([x[l - 2], x[l - 1]])
         x0_last = np.array([x0[l - 2], x0[l - 1]])
 
-        cost += 100 * (x_0 - x0_0).T.dot(x_0 - x0_0)
-        cost += 100 * (x_last - x0_last).T.dot(x_last - x0_last)
+        cost += ENDPOINT_WEIGHT * (x_0 - x0_0).T.dot(x_0 - x0_0)
+        cost += ENDPOINT_WEIGHT * (x_last - x0_last).T.dot(x_last - x0_last)
 
         for i in range(1, int(len(x) / 2) - 1):
             x_i = np.array([x[2*i], x[2*i + 1]])
@@ -48,11 +217,7 @@ class PathSmoother(object):
             dx2 = x_i1 - x_i
 
             theta = np.arctan2(dx2[1], dx2[0]) - np.arctan2(dx1[1], dx1[0])
-
-            # theta_dif = np.math.atan2(np.sin(theta), np.cos(theta))
-            # if ()
-            cost += 0.0001 * (np.math.atan2(np.sin(theta), np.cos(theta))) ** 2
-            # max_a = max(max_a, np.math.atan2(np.sin(theta), np.cos(theta)))
+            cost += HEADING_WEIGHT * (np.arctan2(np.sin(theta), np.cos(theta))) ** 2
 
             d = x_i - (x_1i + x_i1) / 2.0
 
@@ -61,18 +226,11 @@ class PathSmoother(object):
                 x0[2*i + 1]
             ])
 
-            # print((x0_i - x_i).T.dot(x0_i - x_i))
-            cost += 5.0 * (x0_i - x_i).T.dot(x0_i - x_i)
-            cost += 15.0 * d.T.dot(d)
-
-            # cost += 1 * dx_dt[i] * dx_dt[i]
-            # cost += 1 * dy_dt[i] * dy_dt[i]
-
-            # cost += 1 * d2x_dt2[i] * d2x_dt2[i]
-            # cost += 1 * d2y_dt2[i] * d2y_dt2[i]
+            cost += DEVIATION_WEIGHT * (x0_i - x_i).T.dot(x0_i - x_i)
+            cost += MIDPOINT_WEIGHT * d.T.dot(d)
 
             if curvature[i] > self.MAX_CURV:
-                cost += 0.0001 * curvature[i] * curvature[i]
+                cost += CURVATURE_WEIGHT * curvature[i] * curvature[i]
 
         return cost
 
@@ -81,49 +239,204 @@ class PathSmoother(object):
         Path smoothing algorythms.
 
         Args:
-            path (np.ndarray): матрица nx2.
+            path (np.ndarray): матрица nx2 или вектор [x0, y0, x1, y1, ...].
 
         Return:
             np.ndarray: матрица nx2.
         """
-        
-        solution = optimize.minimize(self.objective, 
-                                     x0=path, 
+        path = np.asarray(path, dtype='float64').reshape(-1)
+
+        if self.OPT_METHOD == 'banded':
+            return self._smooth_banded(path)
+
+        solution = optimize.minimize(self.objective,
+                                     x0=path,
                                      method=self.OPT_METHOD,
+                                     jac=self.gradient,
                                      args=(path,),
-                                     #  method='SLSQP',
-                                     tol=self.TOL)#,
+                                     tol=self.TOL)
 
         return np.array(solution.x).reshape((-1, 2))
 
+    def _quadratic_matrix(self, n):
+        u"""
+        Matrix A of the quadratic part of objective: sum(x^T A x) over x and y.
 
-if __name__ == '__main__':
-    # x0 = [[2, 0], [2.0, 0.4], [0.4, 0.4], [0.4, 4.6], [4.6, 4.6], [4.6, 0.4], [3.0, 0.4]]
-    x0 = [[2, 0], [2.0, 8.0], [-5, 8.0]]
+        Return:
+            scipy.sparse.csr_matrix: пятидиагональная матрица nxn.
+        """
+        weights = np.full(n, DEVIATION_WEIGHT)
+        weights[0] = weights[-1] = ENDPOINT_WEIGHT
+
+        inner = np.arange(n - 2)
+        rows = np.repeat(inner, 3)
+        cols = (inner[:, None] + np.arange(3)).reshape(-1)
+        vals = np.tile([-0.5, 1.0, -0.5], n - 2)
+        midpoints = sparse.csr_matrix((vals, (rows, cols)), shape=(n - 2, n))
+
+        return sparse.diags(weights) + MIDPOINT_WEIGHT * (midpoints.T @ midpoints)
+
+    def _residual_jacobian(self, p):
+        u"""
+        Jacobian of heading and curvature residuals (their squares
+        weighted by HEADING_WEIGHT / CURVATURE_WEIGHT form the rest of objective).
+
+        Return:
+            scipy.sparse.csr_matrix: матрица mx2n.
+        """
+        n = len(p)
+        select_x = sparse.csr_matrix((np.ones(n), (np.arange(n), 2 * np.arange(n))), shape=(n, 2 * n))
+        select_y = sparse.csr_matrix((np.ones(n), (np.arange(n), 2 * np.arange(n) + 1)), shape=(n, 2 * n))
+
+        # Курс: theta_i = a_i - a_(i-1), da_j/dp_(j+1) = -da_j/dp_j = q_j
+        v = np.diff(p, axis=0)
+        r2 = v[:, 0] ** 2 + v[:, 1] ** 2
+        q = np.zeros_like(v)
+        nonzero = r2 > 0.0
+        q[nonzero, 0] = -v[nonzero, 1] / r2[nonzero]
+        q[nonzero, 1] = v[nonzero, 0] / r2[nonzero]
+        seg = np.arange(n - 1)
+        heading = sparse.csr_matrix(
+            (np.concatenate([q[:, 0], -q[:, 0], q[:, 1], -q[:, 1]]),
+             (np.tile(seg, 4),
+              np.concatenate([2 * seg + 2, 2 * seg, 2 * seg + 3, 2 * seg + 1]))),
+            shape=(n - 1, 2 * n))
+        diff = sparse.diags([-np.ones(n - 2), np.ones(n - 2)], [0, 1], shape=(n - 2, n - 1))
+        j_heading = np.sqrt(HEADING_WEIGHT) * (diff @ heading)
+
+        # Кривизна: k = |c| / s^1.5 в точках, где она больше MAX_CURV
+        curvature, dx, dy, d2x, d2y = self.calc_curvatire(p)
+        mask = self._curvature_mask(curvature)
+        c = d2x[mask] * dy[mask] - dx[mask] * d2y[mask]
+        s = dx[mask] ** 2 + dy[mask] ** 2
+        dk_dc = np.sign(c) / s ** 1.5
+        dk_ds = -1.5 * np.abs(c) / s ** 2.5
+
+        d1 = _gradient_matrix(n)[mask]
+        d2 = d1 @ _gradient_matrix(n)
+        j_x = sparse.diags(dk_dc * -d2y[mask] + 2.0 * dk_ds * dx[mask]) @ d1 + sparse.diags(dk_dc * dy[mask]) @ d2
+        j_y = sparse.diags(dk_dc * d2x[mask] + 2.0 * dk_ds * dy[mask]) @ d1 + sparse.diags(dk_dc * -dx[mask]) @ d2
+        j_curvature = np.sqrt(CURVATURE_WEIGHT) * (j_x @ select_x + j_y @ select_y)
+
+        return sparse.vstack([j_heading, j_curvature]).tocsr()
+
+    def _smooth_banded(self, path):
+        u"""
+        Direct banded solve of the quadratic part of objective,
+        then Gauss-Newton passes for heading and curvature terms.
+
+        Args:
+            path (np.ndarray): вектор [x0, y0, x1, y1, ...].
+
+        Return:
+            np.ndarray: матрица nx2.
+        """
+        p0 = path.reshape(-1, 2)
+        n = len(p0)
+        if n < 3:
+            return p0.copy()
+
+        a = self._quadratic_matrix(n)
+        weights = np.full(n, DEVIATION_WEIGHT)
+        weights[0] = weights[-1] = ENDPOINT_WEIGHT
+        banded = np.zeros((3, n))
+        for k in range(3):
+            banded[2 - k, k:] = a.diagonal(k)
+        p = solveh_banded(banded, weights[:, None] * p0)
+
+        hessian = 2.0 * sparse.kron(a, sparse.identity(2)).tocsr()
+        x = p.reshape(-1)
+        cost = self.objective(x, path)
+        for _ in range(self.PASSES):
+            jacobian = self._residual_jacobian(x.reshape(-1, 2))
+            step = spsolve((hessian + 2.0 * (jacobian.T @ jacobian)).tocsc(), -self.gradient(x, path))
+
+            # Уменьшение шага, пока стоимость не станет меньше
+            for _ in range(10):
+                new_x = x + step
+                new_cost = self.objective(new_x, path)
+                if new_cost <= cost:
+                    break
+                step *= 0.5
+            else:
+                break
+
+            if cost - new_cost < self.TOL * self.TOL * cost:
+                x, cost = new_x, new_cost
+                break
+            x, cost = new_x, new_cost
+
+        return x.reshape((-1, 2))
+
+
+def _sample_path(step=0.5, scale=1.0):
+    x0 = np.array([[2, 0], [2.0, 8.0], [-5, 8.0]]) * scale
     big_x0 = list()
     for i in range(1, len(x0)):
         p1 = np.array(x0[i-1])
         p2 = np.array(x0[i])
         ds = np.linalg.norm(p1-p2)
 
-        s = np.linspace(p1, p2, num=int(ds / 0.5))
+        s = np.linspace(p1, p2, num=int(ds / step))
         big_x0.extend(s.tolist())
-    x0 = np.array(big_x0)
+    return np.array(big_x0).reshape((-1))
+
+
+def benchmark(sizes=(30, 100, 300, 1000, 10000)):
+    u"""
+    Compare the scalar objective with finite differences against
+    the vectorized objective with analytic gradient and the banded solver.
+    """
+    for n in sizes:
+        # Точки через 5 метров, как после add_points/smooth_coverage_path
+        x0 = _sample_path(step=5.0, scale=n / 3.0)
+        smoother = PathSmoother(1.0 / 5.0, tol=1e-2)
+
+        start = time.perf_counter()
+        smoother._objective_loop(x0, x0)
+        t_loop = time.perf_counter() - start
+        start = time.perf_counter()
+        smoother.objective(x0, x0)
+        t_vec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = smoother.smooth(x0)
+        t_new = time.perf_counter() - start
+
+        start = time.perf_counter()
+        banded = PathSmoother(1.0 / 5.0, tol=1e-2, method='banded').smooth(x0)
+        t_banded = time.perf_counter() - start
+
+        if n <= 100:
+            start = time.perf_counter()
+            old = optimize.minimize(smoother._objective_loop, x0=x0, method='CG',
+                                    args=(x0,), tol=1e-2)
+            t_old = time.perf_counter() - start
+            old_cost = smoother.objective(old.x, x0)
+        else:
+            t_old, old_cost = float('nan'), float('nan')
+
+        print('points: {:5d}  objective: {:.2e}s -> {:.2e}s  '
+              'smooth: {:.3f}s -> {:.3f}s (banded {:.3f}s)  '
+              'cost: {:.4f} -> {:.4f} (banded {:.4f})'.format(
+                  len(x0) // 2, t_loop, t_vec, t_old, t_new, t_banded,
+                  old_cost, smoother.objective(new.reshape(-1), x0),
+                  smoother.objective(banded.reshape(-1), x0)))
 
-    x0 = x0.reshape((-1))
 
-    smoother = PathSmoother(1.0 / 5.0, tol=1e-2)
-    res = smoother.smooth(x0)
+if __name__ == '__main__':
+    import sys
 
-    import matplotlib.pyplot as plt
+    if '--benchmark' in sys.argv:
+        benchmark()
+        sys.exit()
 
-    _x, _y = list(), list()
+    x0 = _sample_path()
 
-    for i in range(int(len(x0) / 2)):
-        _x.append(x0[i*2])
-        _y.append(x0[i*2 + 1])
+    smoother = PathSmoother(1.0 / 5.0, tol=1e-2)
+    res = smoother.smooth(x0)
 
-    # plt.plot(_x, _y)
+    import matplotlib.pyplot as plt
 
     _x, _y = list(), list()
 
@@ -134,4 +447,4 @@ if __name__ == '__main__':
         _y.append(p[1])
 
     plt.plot(_x, _y)
-    plt.show()
\ No newline at end of file
+    plt.show()
@@ -0,0 +1,527 @@
+import bisect
+
+import numpy as np
+
+
+# Tolerance of the coordinate comparisons relative to the polygon size:
+# rotated vertices land off the swath lines by rounding errors (~1e-15)
+RELATIVE_EPS = 1e-9
+
+
+def tolerance(rings):
+    """Absolute comparison tolerance for the rings (RELATIVE_EPS of their extent)"""
+    points = [np.asarray(ring, dtype='float64')[:, :2] for ring in rings if len(ring)]
+    if not points:
+        return RELATIVE_EPS
+    return RELATIVE_EPS * max(1.0, float(np.abs(np.concatenate(points)).max()))
+
+
+def snap_offsets(offsets, xs, eps):
+    """Moves the offsets lying within eps of some vertex x exactly onto it,
+    so that lines touching a vertex are treated as passing through it"""
+    offsets = np.asarray(offsets, dtype='float64')
+    xs = np.unique(xs)
+    if not xs.size or not offsets.size:
+        return offsets
+    i = np.clip(np.searchsorted(xs, offsets), 1, len(xs) - 1) if len(xs) > 1 else np.zeros(len(offsets), int)
+    left = xs[np.maximum(i - 1, 0)]
+    right = xs[i]
+    nearest = np.where(np.abs(offsets - left) <= np.abs(right - offsets), left, right)
+    return np.where(np.abs(offsets - nearest) <= eps, nearest, offsets)
+
+
+def ring_edges(rings):
+    """Edge table (x1, y1, x2, y2) of the given rings (closed or not)"""
+    edges = []
+    for ring in rings:
+        ring = np.asarray(ring, dtype='float64')[:, :2]
+        if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+            ring = ring[:-1]
+        if len(ring) < 2:
+            continue
+        edges.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+    if not edges:
+        return np.empty((0, 4))
+    return np.vstack(edges)
+
+
+def __orientation(o, u, v):
+    return (u[..., 0] - o[..., 0]) * (v[..., 1] - o[..., 1]) - (u[..., 1] - o[..., 1]) * (v[..., 0] - o[..., 0])
+
+
+def __opposite_sides(o, u, a, b, eps):
+    """Whether a and b lie farther than eps from the line (o, u), on opposite sides"""
+    length = np.hypot(*np.moveaxis(u - o, -1, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        da = __orientation(o, u, a) / length
+        db = __orientation(o, u, b) / length
+    return (da * db < 0) & (np.abs(da) > eps) & (np.abs(db) > eps)
+
+
+def segments_entering(edges, starts, ends, eps=0.0):
+    """Segments that may pass through the interior of the ring.
+
+    A segment is reported if it crosses an edge of the ring (all four end
+    points farther than eps from the other line) or its middle point lies
+    inside the ring. This is a cheap filter before an exact intersection.
+
+    Args:
+        edges: edge table of the ring (see ring_edges)
+        starts, ends: (n, 2) arrays of segment end points
+        eps: tolerance, e.g. tolerance(rings)
+
+    Returns:
+        (n,) boolean array
+    """
+    starts = np.asarray(starts, dtype='float64')[:, None, :2]
+    ends = np.asarray(ends, dtype='float64')[:, None, :2]
+    p, q = edges[None, :, :2], edges[None, :, 2:]
+    proper = (__opposite_sides(starts, ends, p, q, eps) &
+              __opposite_sides(p, q, starts, ends, eps)).any(axis=1)
+
+    # Even-odd rule for the middle points
+    x, y = np.moveaxis((starts + ends) / 2.0, 2, 0)
+    x1, y1, x2, y2 = edges.T
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    inside = np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+    return proper | inside
+
+
+def ring_detour(edges, start, end, eps=0.0):
+    """Way around the ring for a segment crossing it.
+
+    Args:
+        edges: edge table of the ring in the order of its vertices (see ring_edges)
+        start, end: end points of the segment
+        eps: tolerance, e.g. tolerance(rings)
+
+    Returns:
+        points of the shorter arc of the ring from the first to the last
+        intersection of the segment with the ring (both included), or None
+        if the segment meets the ring in at most one point
+    """
+    p, e = edges[:, :2], edges[:, 2:] - edges[:, :2]
+    lengths = np.hypot(e[:, 0], e[:, 1])
+    arc = np.concatenate([[0.0], np.cumsum(lengths)])
+    perimeter, arc = arc[-1], arc[:-1]
+
+    start = np.asarray(start, dtype='float64')[:2]
+    d = np.asarray(end, dtype='float64')[:2] - start
+    norm = np.hypot(d[0], d[1])
+    if norm <= eps:
+        return None
+    # start + t * d == p + u * e
+    w = p - start
+    denom = d[0] * e[:, 1] - d[1] * e[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[:, 0] * e[:, 1] - w[:, 1] * e[:, 0]) / denom
+        u = (w[:, 0] * d[1] - w[:, 1] * d[0]) / denom
+        hit = ((denom != 0) & (t >= -eps / norm) & (t <= 1 + eps / norm) &
+               (u >= -eps / lengths) & (u <= 1 + eps / lengths))
+    if np.count_nonzero(hit) < 2:
+        return None
+    t, positions = t[hit], arc[hit] + np.clip(u[hit], 0.0, 1.0) * lengths[hit]
+    first, last = np.argmin(t), np.argmax(t)
+    if (t[last] - t[first]) * norm <= eps:
+        return None
+
+    s, forward = positions[first], (positions[last] - positions[first]) % perimeter
+    if forward <= perimeter - forward:
+        ahead = (arc - s) % perimeter
+        inner = np.flatnonzero((ahead > 0) & (ahead < forward))
+        inner = inner[np.argsort(ahead[inner])]
+    else:
+        behind = (s - arc) % perimeter
+        inner = np.flatnonzero((behind > 0) & (behind < perimeter - forward))
+        inner = inner[np.argsort(behind[inner])]
+    points = [start + t[first] * d] + list(p[inner]) + [start + t[last] * d]
+    return [tuple(point) for point in points]
+
+
+def scanline_crossings(edges, offsets, side='left'):
+    """Crossings of the vertical lines x = offsets[k] with the edges.
+
+    With side='left' an edge crosses line k if xmin <= offsets[k] < xmax,
+    with side='right' if xmin < offsets[k] <= xmax (vertical edges never do),
+    so every line crosses every closed ring an even number of times and
+    consecutive crossings sorted by y pair up into inside intervals
+    (even-odd rule, holes included).
+
+    Returns:
+        (k, y) arrays of the crossings, sorted by k, then by y
+    """
+    offsets = np.asarray(offsets, dtype='float64')
+    x1, y1, x2, y2 = edges.T
+
+    # Sorted edge table: range of lines [k_lo, k_hi) crossed by every edge
+    k_lo = np.searchsorted(offsets, np.minimum(x1, x2), side=side)
+    k_hi = np.searchsorted(offsets, np.maximum(x1, x2), side=side)
+    counts = k_hi - k_lo
+    counts[x1 == x2] = 0
+
+    edge = np.repeat(np.arange(len(edges)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    k = np.repeat(k_lo, counts) + np.arange(counts.sum()) - first
+
+    c = offsets[k]
+    e = edges[edge]
+    y = e[:, 1] + (c - e[:, 0]) * (e[:, 3] - e[:, 1]) / (e[:, 2] - e[:, 0])
+    # Exact y at the vertices, so that touching lines give empty intervals
+    y = np.where(c == e[:, 0], e[:, 1], np.where(c == e[:, 2], e[:, 3], y))
+
+    order = np.lexsort((y, k))
+    return k[order], y[order]
+
+
+def __merge_intervals(k, y_low, y_high):
+    """Union of overlapping or touching intervals of every line"""
+    order = np.lexsort((y_low, k))
+    merged = []
+    for i in order:
+        if merged and merged[-1][0] == k[i] and y_low[i] <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], y_high[i])
+        else:
+            merged.append([k[i], y_low[i], y_high[i]])
+    k, y_low, y_high = np.array(merged, dtype='float64').reshape(-1, 3).T
+    return k.astype(int), y_low, y_high
+
+
+def scanline_segments(rings, offsets, keep_empty=False):
+    """Swath segments of the vertical lines x = offsets[k] inside the polygon.
+
+    Lines passing through a vertex (within tolerance(rings), see snap_offsets)
+    are also intersected from the other side, so edges lying on a line
+    (e.g. at the polygon's max x) are kept as swaths, as the closed polygon
+    intersection does.
+
+    Args:
+        rings: exterior and holes coordinates
+        offsets: sorted x coordinates of the swaths
+        keep_empty: keep zero-length segments (lines touching a vertex,
+                    length up to tolerance(rings))
+
+    Returns:
+        (segments, swath): (m, 2, 2) array of [[x, y_low], [x, y_high]]
+        and (m,) swath index of every segment; sorted by swath, then by y
+    """
+    edges = ring_edges(rings)
+    eps = tolerance(rings)
+    offsets = snap_offsets(offsets, edges[:, 0], eps)
+    k, y = scanline_crossings(edges, offsets)
+    k, y_low, y_high = k[0::2], y[0::2], y[1::2]
+
+    touching = np.flatnonzero(np.isin(offsets, edges[:, 0]))
+    if touching.size:
+        k_right, y_right = scanline_crossings(edges, offsets[touching], side='right')
+        k = np.concatenate([k, touching[k_right[0::2]]])
+        y_low = np.concatenate([y_low, y_right[0::2]])
+        y_high = np.concatenate([y_high, y_right[1::2]])
+        k, y_low, y_high = __merge_intervals(k, y_low, y_high)
+
+    if not keep_empty:
+        nonempty = y_high - y_low > eps
+        k, y_low, y_high = k[nonempty], y_low[nonempty], y_high[nonempty]
+
+    x = offsets[k]
+    segments = np.stack([np.stack([x, y_low], axis=1),
+                         np.stack([x, y_high], axis=1)], axis=1)
+    return segments, k
+
+
+class _Swaths:
+    """Remaining segments of every swath, sorted by y, with skip links over
+    the emptied swaths"""
+
+    def __init__(self, segments, swath):
+        self.bounds = np.sort(segments[:, :, 1], axis=1)
+        order = np.lexsort((self.bounds[:, 0], swath))
+        _, index = np.unique(swath[order], return_index=True)
+        ends = np.append(index[1:], len(order))
+        self.x = segments[order[index], 0, 0]
+        self.ids = [order[i:j].tolist() for i, j in zip(index, ends)]
+        self.low = [self.bounds[ids, 0].tolist() for ids in self.ids]
+        # Nearest non-empty swath to the left / right (with path compression)
+        self.left = list(range(len(index)))
+        self.right = list(range(len(index)))
+
+    def __find(self, links, k):
+        root = k
+        while 0 <= root < len(links) and links[root] != root:
+            root = links[root]
+        while 0 <= k < len(links) and links[k] != k:
+            links[k], k = root, links[k]
+        return root if 0 <= root < len(links) else None
+
+    def nearest_left(self, k):
+        return self.__find(self.left, k)
+
+    def nearest_right(self, k):
+        return self.__find(self.right, k)
+
+    def nearest_in(self, k, y):
+        """(dy, y_low, i) of the segment of swath k nearest to y"""
+        low, ids = self.low[k], self.ids[k]
+        i = bisect.bisect_right(low, y)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(ids):
+                y_low, y_high = self.bounds[ids[j]]
+                dy = max(y_low - y, y - y_high, 0.0)
+                if best is None or dy < best[0]:
+                    best = (dy, y_low, j)
+        return best
+
+    def remove(self, k, j):
+        del self.low[k][j]
+        i = self.ids[k].pop(j)
+        if not self.ids[k]:
+            self.left[k], self.right[k] = k - 1, k + 1
+        return i
+
+
+def order_segments(segments, swath, origin):
+    """Greedy coverage order of the swath segments.
+
+    Starting from origin, the remaining segment nearest to the current point
+    (ties: nearest to the previous point, lower swath, lower y) is driven from its nearer end to the
+    other one. Only the swaths closer in x than the best segment found so far
+    are searched (outwards from the current point, so usually just the
+    neighbouring ones), which keeps the ordering O(n log n) for n segments.
+
+    Args:
+        segments: (m, 2, 2) array of segment end points
+        swath: (m,) swath index of every segment (swaths sorted by x)
+        origin: starting point
+
+    Returns:
+        (2 * m, 2) array of points: origin, then for every segment its
+        entry point followed by its exit point (the last exit is omitted)
+    """
+    segments = np.asarray(segments, dtype='float64')
+    if not len(segments):
+        return np.empty((0, 2))
+    swaths = _Swaths(segments, np.asarray(swath))
+    origin = np.asarray(origin, dtype='float64').reshape(2)
+
+    results = [origin]
+
+    def previous(k, j):
+        # Distance from the previous origin, to break ties as the old list
+        # sort did (it kept the order of the previous step for equal distances)
+        if len(results) < 3:
+            return 0.0
+        dx = swaths.x[k] - results[-3][0]
+        y_low, y_high = swaths.bounds[swaths.ids[k][j]]
+        return np.hypot(dx, max(y_low - results[-3][1], results[-3][1] - y_high, 0.0))
+
+    for _ in range(len(segments)):
+        px, py = results[-1]
+        k0 = int(np.searchsorted(swaths.x, px))
+        best = None
+        left, right = swaths.nearest_left(k0 - 1), swaths.nearest_right(k0)
+        while left is not None or right is not None:
+            dx_left = px - swaths.x[left] if left is not None else np.inf
+            dx_right = swaths.x[right] - px if right is not None else np.inf
+            if dx_left <= dx_right:
+                k, dx, left = left, dx_left, swaths.nearest_left(left - 1)
+            else:
+                k, dx, right = right, dx_right, swaths.nearest_right(right + 1)
+            if best is not None and dx > best[0]:
+                break
+            dy, y_low, j = swaths.nearest_in(k, py)
+            candidate = (np.hypot(dx, dy), previous(k, j), k, y_low, j)
+            if best is None or candidate[:4] < best[:4]:
+                best = candidate
+
+        segment = segments[swaths.remove(best[2], best[4])]
+        d = np.hypot(*(segment - results[-1]).T)
+        start, end = (segment[1], segment[0]) if d[1] < d[0] else segment
+        results[-1:] = [results[-1], start, end]
+    return np.array(results[:-1])
+
+
+# Held-Karp is used to order at most this many cells, greedy search and 2-opt otherwise
+DP_CELLS = 10
+
+
+def decompose_cells(segments, swath):
+    """Boustrophedon cell decomposition of the swath segments.
+
+    Segments of neighbouring swaths are joined into one cell while their
+    y-intervals overlap one-to-one; the cells split where a swath branches
+    or merges (at the critical points of the polygon: holes, concavities).
+
+    Returns:
+        list of arrays of segment indices, one per cell, ordered by swath
+    """
+    bounds = np.sort(np.asarray(segments)[:, :, 1], axis=1)
+    swath = np.asarray(swath)
+    order = np.lexsort((bounds[:, 0], swath))
+    keys, index = np.unique(swath[order], return_index=True)
+    groups = np.split(order, index[1:])
+
+    following = np.full(len(swath), -1)
+    has_previous = np.zeros(len(swath), dtype=bool)
+    for k in range(len(groups) - 1):
+        if keys[k + 1] != keys[k] + 1:
+            continue
+        a, b = groups[k], groups[k + 1]
+        # Overlapping segments of the next swath: [first, last)
+        first = np.searchsorted(bounds[b, 1], bounds[a, 0], side='right')
+        last = np.searchsorted(bounds[b, 0], bounds[a, 1], side='left')
+        overlaps = np.maximum(last - first, 0)
+        counts = np.zeros(len(b), dtype=int)
+        for f, l in zip(first, last):
+            counts[f:l] += 1
+        for i in np.flatnonzero(overlaps == 1):
+            if counts[first[i]] == 1:
+                following[a[i]] = b[first[i]]
+                has_previous[b[first[i]]] = True
+
+    cells = []
+    for start in order[~has_previous[order]]:
+        cell = [start]
+        while following[cell[-1]] >= 0:
+            cell.append(following[cell[-1]])
+        cells.append(np.array(cell))
+    return cells
+
+
+def cell_paths(segments):
+    """Boustrophedon paths through the segments of one cell.
+
+    Returns:
+        (4, 2 * m, 2) array: paths starting at the first or the last swath,
+        at the low or the high end of it
+    """
+    bounds = np.sort(np.asarray(segments, dtype='float64'), axis=1)
+    paths = []
+    for from_last in (False, True):
+        ordered = bounds[::-1] if from_last else bounds
+        for from_high in (False, True):
+            flip = (np.arange(len(ordered)) % 2 == 1) != from_high
+            points = np.where(flip[:, None, None], ordered[:, ::-1], ordered)
+            paths.append(points.reshape(-1, 2))
+    return np.array(paths)
+
+
+def __reversed_configs(paths):
+    """Index of the configuration that drives every path backwards"""
+    return [next(d for d in range(len(paths)) if np.array_equal(paths[d], paths[c][::-1]))
+            for c in range(len(paths))]
+
+
+def __order_held_karp(start, transit):
+    """Optimal (cell, config) order: start (n, 4) costs, transit (4n, 4n) costs"""
+    n = len(start)
+    dp = np.full((1 << n, 4 * n), np.inf)
+    parent = np.full((1 << n, 4 * n), -1)
+    for j in range(n):
+        dp[1 << j, 4 * j: 4 * j + 4] = start[j]
+    for mask in range(1, 1 << n):
+        row = dp[mask]
+        if not np.isfinite(row).any():
+            continue
+        for j in range(n):
+            if mask & (1 << j):
+                continue
+            values = row[:, None] + transit[:, 4 * j: 4 * j + 4]
+            best = values.argmin(axis=0)
+            cost = values[best, np.arange(4)]
+            target = dp[mask | (1 << j), 4 * j: 4 * j + 4]
+            better = cost < target
+            target[better] = cost[better]
+            parent[mask | (1 << j), 4 * j: 4 * j + 4][better] = best[better]
+
+    mask, node = (1 << n) - 1, int(dp[-1].argmin())
+    order = []
+    while node >= 0:
+        order.append(divmod(node, 4))
+        mask, node = mask & ~(1 << (node // 4)), parent[mask, node]
+    return order[::-1]
+
+
+def __best_configs(cells, start, transit):
+    """Best configs of the cells in the given order (dynamic programming)"""
+    cost = start[cells[0]].copy()
+    choices = []
+    for a, b in zip(cells[:-1], cells[1:]):
+        values = cost[:, None] + transit[4 * a: 4 * a + 4, 4 * b: 4 * b + 4]
+        choices.append(values.argmin(axis=0))
+        cost = values.min(axis=0)
+    configs = [int(cost.argmin())]
+    for choice in choices[::-1]:
+        configs.append(int(choice[configs[-1]]))
+    return configs[::-1], cost.min()
+
+
+def __order_two_opt(origin, start, transit, entries, exits, reverse, max_rounds=10):
+    """Greedy nearest (cell, config) order improved by 2-opt and config search"""
+    n = len(start)
+    order, cost = [], start.ravel()
+    remaining = np.ones(n, dtype=bool)
+    for _ in range(n):
+        node = int(np.where(np.repeat(remaining, 4), cost, np.inf).argmin())
+        order.append(divmod(node, 4))
+        remaining[node // 4] = False
+        cost = transit[node]
+
+    best = np.inf
+    for _ in range(max_rounds):
+        # 2-opt: reversing the part i..j of the order drives its cells
+        # backwards, so only the transits into i and out of j change
+        improved = True
+        while improved:
+            improved = False
+            for i in range(n - 1):
+                nodes = np.array([4 * c + k for c, k in order])
+                before = exits[nodes[i - 1]] if i else origin
+                head = entries[nodes[i]]
+                tails = exits[nodes[i + 1:]]
+                after = entries[nodes[i + 2:]]
+                gain = np.hypot(*(before - head)) - np.hypot(*(before - tails).T)
+                # (reversing up to the end leaves no transit out of j)
+                gain[:-1] += np.hypot(*(tails[:-1] - after).T) - np.hypot(*(head - after).T)
+                j = int(gain.argmax())
+                if gain[j] > 1e-9:
+                    part = order[i: i + j + 2]
+                    order[i: i + j + 2] = [(c, reverse[c][k]) for c, k in part[::-1]]
+                    improved = True
+
+        cells = [c for c, _ in order]
+        configs, cost = __best_configs(cells, start, transit)
+        order = list(zip(cells, configs))
+        if cost >= best - 1e-9:
+            break
+        best = cost
+    return order
+
+
+def order_cells(paths, origin):
+    """Order of the cells and their sweep configurations with the shortest
+    transits, starting from origin.
+
+    Args:
+        paths: list of (4, L, 2) arrays of cell paths (see cell_paths)
+        origin: starting point
+
+    Returns:
+        (L, 2) array: the cell paths joined in the found order
+    """
+    if not len(paths):
+        return np.empty((0, 2))
+    n = len(paths)
+    entries = np.array([p[:, 0] for p in paths]).reshape(-1, 2)
+    exits = np.array([p[:, -1] for p in paths]).reshape(-1, 2)
+    origin = np.asarray(origin, dtype='float64').reshape(2)
+    start = np.hypot(*(entries - origin).T).reshape(n, 4)
+    transit = np.hypot(exits[:, None, 0] - entries[None, :, 0], exits[:, None, 1] - entries[None, :, 1])
+
+    if n <= DP_CELLS:
+        order = __order_held_karp(start, transit)
+    else:
+        reverse = [__reversed_configs(p) for p in paths]
+        order = __order_two_opt(origin, start, transit, entries, exits, reverse)
+    return np.vstack([paths[c][k] for c, k in order])
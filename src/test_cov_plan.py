@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 from matplotlib.collections import LineCollection
 
 
+from angle_search import AngleSearch
 from coverage_planning import AreaPolygon
 from utm import Converter
 from border_path import build_path, build_path2
@@ -104,14 +105,15 @@ def find_best():
     conv = Converter(sys.argv[1])
     ext = shift(conv.get_cartesian(), 50)
     holes = [] #[[(0, 3), (2, 3), (1, 6), (-3, 5)]]
-    
-    angles = list()
-    for angle in np.linspace(0.0, 90.0, num=90):
+
+    def evaluate(angle):
         polygon = AreaPolygon(ext, ext[0], interior=holes, ft=20, angle=angle)
         ll = polygon.get_area_coverage()
-        angles.append((ll.length, angle))
+        return ll.length, angle, None
 
-    print(sorted(angles)[0])
+    search = AngleSearch(evaluate)
+    best = search.grid(0.0, 90.0, num=90)
+    print(best[:2], 'evaluations:', search.evaluations)
 
 
 if __name__ == '__main__':
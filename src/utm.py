@@ -1,9 +1,21 @@
+import numpy as np
 import pyproj
 import shapefile
 
+from shp_reader import ShapeFileMap, organize_rings
 
+
+# UTM false northing for the southern hemisphere, metres
+FALSE_NORTHING = 10000000
+
+# zone -> pyproj.Transformer (lon, lat) <-> (x, y)
 _projections = {}
 
+POLYGON_TYPES = (shapefile.POLYGON, shapefile.POLYGONZ, shapefile.POLYGONM)
+
+# Projections of Field: 'zone' - UTM zone, 'local' - transverse Mercator centred on the field
+PROJECTIONS = ('zone', 'local')
+
 
 def zone(coordinates):
     if 56 <= coordinates[1] < 64 and 3 <= coordinates[0] < 12:
@@ -23,62 +35,161 @@ def letter(coordinates):
     return 'CDEFGHJKLMNPQRSTUVWXX'[int((coordinates[1] + 80) / 8)]
 
 
+def transformer(zone):
+    u"""
+    Cached transformer between WGS84 (lon, lat) and the UTM zone (x, y).
+    Northings are not shifted: they are negative in the southern hemisphere.
+    """
+    if zone not in _projections:
+        _projections[zone] = pyproj.Transformer.from_crs(
+            pyproj.CRS(proj='longlat', ellps='WGS84'),
+            pyproj.CRS(proj='utm', zone=zone, ellps='WGS84'),
+            always_xy=True)
+    return _projections[zone]
+
+
+def _as_points(coords):
+    points = np.asarray(coords, dtype='float64')
+    if points.ndim != 2:
+        points = points.reshape((-1, 2))
+    return points[:, :2]
+
+
+def local_transformer(lon, lat):
+    u"""
+    Transformer between WGS84 (lon, lat) and a transverse Mercator projection
+    centred on (lon, lat). Not cached: every field has its own centre.
+    """
+    return pyproj.Transformer.from_crs(
+        pyproj.CRS(proj='longlat', ellps='WGS84'),
+        pyproj.CRS(proj='tmerc', lon_0=lon, lat_0=lat, k=1.0, x_0=0.0, y_0=0.0, ellps='WGS84'),
+        always_xy=True)
+
+
+def _transform(coords, transformer, inverse=False):
+    points = _as_points(coords)
+    direction = pyproj.enums.TransformDirection.INVERSE if inverse else pyproj.enums.TransformDirection.FORWARD
+    x, y = transformer.transform(points[:, 0], points[:, 1], direction=direction)
+    return np.column_stack((x, y))
+
+
+def project_points(coords, zone):
+    u"""
+    Args:
+        coords: (lon, lat) points, array-like n x 2 (extra columns are ignored).
+        zone (int): UTM zone.
+
+    Return:
+        numpy.ndarray n x 2 of (x, y), the input is not modified.
+    """
+    return _transform(coords, transformer(zone))
+
+
+def unproject_points(coords, zone):
+    u"""
+    Inverse of project_points.
+
+    Return:
+        numpy.ndarray n x 2 of (lon, lat), the input is not modified.
+    """
+    return _transform(coords, transformer(zone), inverse=True)
+
+
 def project(coordinates):
     z = zone(coordinates)
     l = letter(coordinates)
-    if z not in _projections:
-        _projections[z] = pyproj.Proj(proj='utm', zone=z, ellps='WGS84')
-    x, y = _projections[z](coordinates[0], coordinates[1])
+    x, y = project_points([coordinates], z)[0].tolist()
     if y < 0:
-        y += 10000000
+        y += FALSE_NORTHING
     return z, l, x, y
 
 
-def unproject(proj, l, coords):
+def unproject(z, l, coords):
+    u"""
+    Inverse of project for many points of one zone (northings with the false
+    northing in the southern hemisphere, as returned by project).
+
+    Return:
+        list of (lon, lat), the input is not modified.
+    """
+    points = _as_points(coords)
     if l < 'N':
-        for p in coords:
-            p[1] -= 10000000
-    wgs = [proj(p[0], p[1], inverse=True) for p in coords]
-    return wgs
+        points = points - (0.0, FALSE_NORTHING)
+    return [tuple(p) for p in unproject_points(points, z).tolist()]
 
 
-class Converter(object):
-    def __init__(self, shp_file):
+class Field(object):
+    def __init__(self, polygon, holes=(), record=None, index=0, part=0, projection='zone', z=None):
         u"""
+        Field boundary in WGS84 and cartesian coordinates.
+
         Args:
-            shp_file (str): path to shp file.
+            polygon: exterior ring, (lon, lat) points (list or numpy array).
+            holes: interior rings, (lon, lat) points.
+            record (dict): attributes of the shapefile record.
+            index (int): index of the shapefile record.
+            part (int): index of the polygon in a multipolygon record.
+            projection (str): 'zone' - UTM zone z (by default the zone of the
+                field centre), 'local' - transverse Mercator centred on the
+                field (no distortion for fields on a zone edge).
         """
-        sf = shapefile.Reader(shp_file)
-        feature = sf.shapeRecords()[0]
-        first = feature.shape.__geo_interface__ 
-        # polygon = first['coordinates'] if isinstance(first['coordinates'], list) else first['coordinates'][0]
-        polygon = first['coordinates'][0] if isinstance(first['coordinates'][0], list) else first['coordinates']
-
-        
-        self.z = zone(polygon[0])
-        self.letter = letter(polygon[0])
+        points = _as_points(polygon)
+        center = points.mean(axis=0).tolist()
 
-        self.proj = self.__converter(self.z)
+        self.z = zone(center) if z is None else z
+        self.letter = letter(polygon[0])
+        if projection == 'zone':
+            self.transformer = transformer(self.z)
+        elif projection == 'local':
+            self.transformer = local_transformer(*center)
+        else:
+            raise ValueError("Unknown projection: {}".format(projection))
+        self.projection = projection
 
-        self.cartesian = [self.proj(p[0], p[1])for p in polygon]
+        self.record = record or {}
+        self.index = index
+        self.part = part
         self.wgs = polygon
+        self.holes_wgs = list(holes)
+        self.cartesian = [tuple(p) for p in _transform(points, self.transformer).tolist()]
+        self.holes = [[tuple(p) for p in _transform(h, self.transformer).tolist()] for h in holes]
 
-    def __converter(self, zone):
-        proj = pyproj.Proj(proj='utm', zone=zone, ellps='WGS84')
-        return proj
+    @property
+    def name(self):
+        u"""FieldName or Name attribute (as in Trimble files) or the record index."""
+        name = self.record.get('FieldName') or self.record.get('Name')
+        return str(name) if name else str(self.index)
 
     def transform_to_cartesian(self, coords):
-        pass
+        u"""
+        WGS84 (lon, lat) points to the cartesian coordinates of this polygon.
+
+        Return:
+            numpy.ndarray if coords is an array, otherwise list of tuples.
+        """
+        return self.__result(_transform(coords, self.transformer), coords)
 
     def to_wgs(self, coords):
-        return unproject(self.proj, self.letter, coords)
+        u"""
+        Cartesian points (as returned by get_cartesian) to WGS84 (lon, lat).
+
+        Return:
+            numpy.ndarray if coords is an array, otherwise list of tuples.
+        """
+        return self.__result(_transform(coords, self.transformer, inverse=True), coords)
+
+    @staticmethod
+    def __result(points, coords):
+        if isinstance(coords, np.ndarray):
+            return points
+        return [tuple(p) for p in points.tolist()]
 
     def get_wgs(self):
         u"""
         Return polygon in wgs coordinates.
 
         Return:
-            list.
+            list or numpy.ndarray (a view of the memory mapped file).
         """
         return self.wgs
 
@@ -92,6 +203,82 @@ class Converter(object):
         return self.cartesian
 
 
+class Converter(Field):
+    def __init__(self, shp_file):
+        u"""
+        First polygon of the shp file in the UTM zone of its first vertex.
+
+        Args:
+            shp_file (str): path to shp file.
+        """
+        with ShapeFileMap(shp_file) as shp, shapefile.Reader(shp_file) as sf:
+            rings = organize_rings(shp.rings(0))[0]
+            record = _record(sf, 0)
+
+        super().__init__(rings[0], rings[1:], record=record, z=zone(rings[0][0]))
+
+
+def _record(sf, index):
+    try:
+        return sf.record(index).as_dict()
+    except (shapefile.ShapefileException, IndexError, AttributeError):
+        # нет .dbf
+        return {}
+
+
+def _ring_fields(rings, record, index, projection):
+    for part, polygon in enumerate(organize_rings(rings)):
+        yield Field(polygon[0], polygon[1:], record, index, part, projection)
+
+
+def iter_fields(shp_file, projection='zone'):
+    u"""
+    Lazily reads all polygons of the shp file. Points come from the memory
+    mapped file (shp_reader.ShapeFileMap) as numpy views, so memory does not
+    grow with the file size. A multipolygon record gives a Field per polygon
+    (with the same index and increasing part).
+
+    Args:
+        shp_file (str): path to shp file.
+        projection (str): see Field.
+
+    Return:
+        generator of Field.
+    """
+    with ShapeFileMap(shp_file) as shp, shapefile.Reader(shp_file) as sf:
+        if shp.shape_type not in POLYGON_TYPES:
+            return
+        for index in range(len(shp)):
+            yield from _ring_fields(shp.rings(index), _record(sf, index), index, projection)
+
+
+def read_fields(shp_file, index, projection='zone'):
+    u"""
+    Polygons of one record of the shp file (random access through .shx).
+
+    Return:
+        list of Field.
+    """
+    with ShapeFileMap(shp_file) as shp, shapefile.Reader(shp_file) as sf:
+        return list(_ring_fields(shp.rings(index), _record(sf, index), index, projection))
+
+
+def fields_by_zone(fields):
+    u"""
+    Groups fields by UTM zone.
+
+    Args:
+        fields: iterable of Field (e.g. iter_fields(...)).
+
+    Return:
+        dict {zone: [Field]}.
+    """
+    groups = {}
+    for field in fields:
+        groups.setdefault(field.z, []).append(field)
+    return groups
+
+
 if __name__ == '__main__':
     import sys
     import matplotlib.pyplot as plt
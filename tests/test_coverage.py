@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+
+from coverage_planning import AreaPolygon
+from field_generator import U_TEMPLATE
+from swaths import tolerance
+
+
+# Длина покрытия U-образного поля (border_3) под углом 0 на базовой версии
+# (пересечение линий с полигоном в shapely)
+BASELINE_U_LENGTH = {5: 1210.460, 10: 675.616}
+
+
+def test_u_shape_has_no_degenerate_swaths():
+    # Линия x = 0 касается поля только из-за ошибки округления поворота (~1e-15)
+    polygon = AreaPolygon(U_TEMPLATE, U_TEMPLATE[0], interior=[], ft=10, angle=0)
+    segments, _, _ = polygon.generate_segments()
+    eps = tolerance(polygon.rotated_rings())
+    assert np.all(np.abs(segments[:, 1, 1] - segments[:, 0, 1]) > eps)
+
+
+def test_u_shape_length_matches_baseline():
+    for ft, baseline in BASELINE_U_LENGTH.items():
+        polygon = AreaPolygon(U_TEMPLATE, U_TEMPLATE[0], interior=[], ft=ft, angle=0)
+        length = polygon.get_area_coverage().length
+        # Порядок равноудалённых полос может отличаться от базовой версии
+        # не более чем на один переезд между соседними полосами
+        assert length <= baseline + ft + 1e-6
@@ -0,0 +1,24 @@
+import os
+import sys
+
+from shapely import geometry
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+
+from field_generator import generate_field
+from planning import PlanningSession
+
+
+def test_coverage_avoids_holes():
+    exterior, holes = generate_field('holes', seed=0, vertices=64, area=200000)
+    border = [tuple(p) for p in exterior]
+    session = PlanningSession(border, 5.0, {'sweep_workers': 1}, holes=holes)
+    debug_data = {}
+    path = session.plan(border[0], border[-5], debug_data=debug_data)
+
+    assert path
+    # Препятствия дошли до полигона покрытия
+    assert len(debug_data['cov_holes']) == len(holes)
+    coverage = geometry.LineString(debug_data['cov_path'])
+    for hole in holes:
+        assert geometry.Polygon(hole).intersection(coverage).length < 1e-6